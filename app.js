@@ -1,15 +1,26 @@
 // --- WebSocket Client for Shoot the Gate ---
 
-const WS_URL = `ws://${window.location.hostname}:8765`;
+// Shared port; in multi-worker mode a REDIRECT moves us to the table owner's port
+let wsUrl = `ws://${window.location.hostname}:8765`;
 
 let ws;
 let myPlayerId = null;
+let currentState = null;  // last full state, PATCHes are applied on top of it
+// JOIN of the current tab plus the server's resume token, so a dropped
+// connection reclaims the same seat instead of joining as a new player
+let session = JSON.parse(sessionStorage.getItem('session') || 'null');
+let spectating = false;  // watching a table without a seat
+// STATE/PATCH wire format requested at JOIN: compact 'msgpack' binary frames
+// by default, ?codec=json for readable frames while debugging
+const WIRE_CODEC = new URLSearchParams(window.location.search).get('codec') === 'json' ? 'json' : 'msgpack';
 
 // DOM Elements
 const els = {
     loginModal: document.getElementById('login-modal'),
     usernameInput: document.getElementById('username-input'),
+    tableInput: document.getElementById('table-input'),
     joinBtn: document.getElementById('join-btn'),
+    watchBtn: document.getElementById('watch-btn'),
     connStatus: document.getElementById('connection-status'),
     pot: document.getElementById('pot-display'),
     msg: document.getElementById('message-area'),
@@ -23,6 +34,7 @@ const els = {
     btnPass: document.getElementById('pass-btn'),
     highLowControls: document.getElementById('high-low-controls'),
     myStatus: document.getElementById('my-status'),
+    oddsHint: document.getElementById('odds-hint'),
     playersContainer: document.getElementById('players-container'),
     timerBarContainer: document.getElementById('timer-bar-container'),
     timerBar: document.getElementById('timer-bar'),
@@ -36,32 +48,54 @@ let prevRoundPhase = 'WAITING';
 
 // --- WebSocket Connection ---
 function connect() {
-    ws = new WebSocket(WS_URL);
+    ws = new WebSocket(wsUrl);
+    ws.binaryType = 'arraybuffer';
 
     ws.onopen = () => {
         els.connStatus.innerText = 'Connected! Enter your name.';
         els.connStatus.style.color = '#10b981';
         els.joinBtn.disabled = false;
+        els.watchBtn.disabled = false;
+        if (session && session.watch) {
+            ws.send(JSON.stringify({ type: 'WATCH', ...session.join }));
+        } else if (session) {
+            ws.send(JSON.stringify({ type: 'JOIN', ...session.join, resume: session.token }));
+        }
     };
 
     ws.onmessage = (event) => {
-        const data = JSON.parse(event.data);
+        const data = typeof event.data === 'string' ? JSON.parse(event.data) : decodeMsgpack(event.data);
         if (data.type === 'WELCOME') {
             myPlayerId = data.your_id;
+            spectating = data.role === 'spectator';
+            session.token = data.token || null;
+            sessionStorage.setItem('session', JSON.stringify(session));
             els.loginModal.classList.add('hidden');
+        } else if (data.type === 'REDIRECT') {
+            // Another worker owns this table; rejoin there (onopen resends the JOIN)
+            wsUrl = `ws://${window.location.hostname}:${data.port}`;
+            ws.onclose = null;
+            ws.close();
+            connect();
         } else if (data.type === 'STATE') {
-            renderState(data.state);
+            currentState = data.state;
+            renderState(currentState);
+        } else if (data.type === 'PATCH') {
+            applyPatch(data);
         } else if (data.type === 'ERROR') {
             alert(data.msg);
             // If kicked for inactivity, show login modal to allow rejoin
             if (data.msg.includes('inactivity')) {
                 myPlayerId = null;
+                session = null;
+                sessionStorage.removeItem('session');
                 els.loginModal.classList.remove('hidden');
             }
         }
     };
 
     ws.onclose = () => {
+        currentState = null;
         els.connStatus.innerText = 'Disconnected. Reconnecting...';
         els.connStatus.style.color = '#ef4444';
         setTimeout(connect, 3000);
@@ -73,12 +107,95 @@ function connect() {
     };
 }
 
+// --- MessagePack Decoder (binary STATE/PATCH frames) ---
+const textDecoder = new TextDecoder();
+
+function decodeMsgpack(buffer) {
+    const view = new DataView(buffer);
+    const bytes = new Uint8Array(buffer);
+    let pos = 0;
+
+    function str(n) {
+        const s = textDecoder.decode(bytes.subarray(pos, pos + n));
+        pos += n;
+        return s;
+    }
+    function array(n) {
+        const out = new Array(n);
+        for (let i = 0; i < n; i++) out[i] = read();
+        return out;
+    }
+    function map(n) {
+        const out = {};
+        for (let i = 0; i < n; i++) {
+            const key = read();
+            out[key] = read();
+        }
+        return out;
+    }
+    function read() {
+        const b = bytes[pos++];
+        if (b < 0x80) return b;
+        if (b >= 0xe0) return b - 0x100;
+        if (b >= 0xa0 && b <= 0xbf) return str(b & 0x1f);
+        if (b >= 0x90 && b <= 0x9f) return array(b & 0x0f);
+        if (b >= 0x80 && b <= 0x8f) return map(b & 0x0f);
+        let v;
+        switch (b) {
+            case 0xc0: return null;
+            case 0xc2: return false;
+            case 0xc3: return true;
+            case 0xcc: v = view.getUint8(pos); pos += 1; return v;
+            case 0xcd: v = view.getUint16(pos); pos += 2; return v;
+            case 0xce: v = view.getUint32(pos); pos += 4; return v;
+            case 0xcf: v = Number(view.getBigUint64(pos)); pos += 8; return v;
+            case 0xd0: v = view.getInt8(pos); pos += 1; return v;
+            case 0xd1: v = view.getInt16(pos); pos += 2; return v;
+            case 0xd2: v = view.getInt32(pos); pos += 4; return v;
+            case 0xd3: v = Number(view.getBigInt64(pos)); pos += 8; return v;
+            case 0xca: v = view.getFloat32(pos); pos += 4; return v;
+            case 0xcb: v = view.getFloat64(pos); pos += 8; return v;
+            case 0xd9: v = view.getUint8(pos); pos += 1; return str(v);
+            case 0xda: v = view.getUint16(pos); pos += 2; return str(v);
+            case 0xdb: v = view.getUint32(pos); pos += 4; return str(v);
+            case 0xdc: v = view.getUint16(pos); pos += 2; return array(v);
+            case 0xdd: v = view.getUint32(pos); pos += 4; return array(v);
+            case 0xde: v = view.getUint16(pos); pos += 2; return map(v);
+            case 0xdf: v = view.getUint32(pos); pos += 4; return map(v);
+        }
+        throw new Error(`Unsupported MessagePack byte 0x${b.toString(16)}`);
+    }
+    return read();
+}
+
+// --- Incremental updates ---
+function applyPatch(patch) {
+    if (!currentState || currentState.update_id !== patch.base_id) {
+        // Missed an update: ask for a full STATE instead of guessing
+        ws.send(JSON.stringify({ type: 'RESYNC' }));
+        return;
+    }
+    Object.assign(currentState, patch.set);
+    currentState.update_id = patch.update_id;
+    renderState(currentState);
+}
+
 // --- Join ---
 els.joinBtn.addEventListener('click', () => {
     const name = els.usernameInput.value.trim();
     if (!name) return;
     const ante = parseInt(document.getElementById('ante-input').value) || 10;
-    ws.send(JSON.stringify({ type: 'JOIN', name, ante }));
+    const table = els.tableInput.value.trim() || 'main';
+    const join = { name, ante, table, codec: WIRE_CODEC };
+    session = { join, token: null };
+    ws.send(JSON.stringify({ type: 'JOIN', ...join }));
+});
+
+els.watchBtn.addEventListener('click', () => {
+    const table = els.tableInput.value.trim() || 'main';
+    const join = { table, codec: WIRE_CODEC };
+    session = { join, token: null, watch: true };
+    ws.send(JSON.stringify({ type: 'WATCH', ...join }));
 });
 
 els.usernameInput.addEventListener('keydown', (e) => {
@@ -111,8 +228,24 @@ els.betSlider.addEventListener('input', (e) => {
     els.betDisplay.innerText = `$${e.target.value}`;
 });
 
+// --- Cards ---
+// Server sends cards as ints 0-51: suit = floor(code / 13), rank = code % 13
+const SUITS = ['♠', '♥', '♦', '♣'];
+const DISPLAYS = ['A', '2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K'];
+
+function decodeCard(code) {
+    if (code === null || code === undefined) return null;
+    const suitIdx = Math.floor(code / 13);
+    return {
+        display: DISPLAYS[code % 13],
+        suit: SUITS[suitIdx],
+        color: suitIdx === 1 || suitIdx === 2 ? 'red' : 'black'
+    };
+}
+
 // --- Render Card ---
-function renderCard(el, card) {
+function renderCard(el, code) {
+    const card = decodeCard(code);
     if (!card) {
         el.innerHTML = '<div class="card-back">🂠</div>';
         el.className = 'card card-empty';
@@ -168,6 +301,25 @@ function renderPlayers(players) {
     });
 }
 
+// --- Odds Hint ---
+function pct(p) {
+    return `${Math.round(p * 100)}%`;
+}
+
+function renderOdds(odds) {
+    if (!odds) {
+        els.oddsHint.classList.add('hidden');
+        return;
+    }
+    if (odds.high !== undefined) {
+        els.oddsHint.innerText = `Higher ${pct(odds.high)} · Lower ${pct(odds.low)} · Post ${pct(odds.post)}`;
+    } else {
+        const ev = odds.ev >= 0 ? `+${odds.ev.toFixed(2)}` : odds.ev.toFixed(2);
+        els.oddsHint.innerText = `Win ${pct(odds.win)} · Post ${pct(odds.post)} · Miss ${pct(odds.miss)} · EV ${ev}/$`;
+    }
+    els.oddsHint.classList.remove('hidden');
+}
+
 // --- Timer Bar ---
 function startTimerBar(deadline) {
     stopTimerBar();
@@ -208,10 +360,13 @@ function renderState(state) {
     // Message
     els.msg.innerText = state.message;
 
-    // My cards
-    renderCard(els.cardLeft, state.my_cards.left);
-    renderCard(els.cardRight, state.my_cards.right);
-    renderCard(els.cardResult, state.my_cards.result);
+    // My cards (spectator frames carry no private fields)
+    const myCards = state.my_cards || {};
+    renderCard(els.cardLeft, myCards.left);
+    renderCard(els.cardRight, myCards.right);
+    renderCard(els.cardResult, myCards.result);
+
+    renderOdds(state.my_odds);
 
     // My status message
     if (state.my_result_msg) {
@@ -239,6 +394,15 @@ function renderState(state) {
     // Controls
     els.highLowControls.classList.add('hidden');
 
+    if (spectating) {
+        els.btnDeal.disabled = true;
+        els.btnDeal.innerText = 'Watching';
+        els.btnShoot.disabled = true;
+        els.btnPass.disabled = true;
+        els.betSlider.disabled = true;
+        return;
+    }
+
     if (roundPhase === 'WAITING') {
         // Anyone can start the game
         els.btnDeal.disabled = false;
@@ -286,4 +450,7 @@ function renderState(state) {
 }
 
 // --- Init ---
+// Allow sharing a link straight to a table: index.html?table=friends
+const tableParam = new URLSearchParams(window.location.search).get('table');
+if (tableParam) els.tableInput.value = tableParam;
 connect();
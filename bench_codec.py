@@ -0,0 +1,93 @@
+"""Compare wire codecs: bytes and microseconds per STATE / PATCH message.
+
+    python bench_codec.py --players 8,50 --iterations 2000
+
+For each codec backend available here (stdlib json, orjson, pure-Python
+MessagePack, the msgpack package) this builds a mid-round table and times:
+  cold   - first STATE of an update (public part encoded + private fragment)
+  warm   - every further socket's STATE (public part served from cache)
+  patch  - a countdown tick PATCH (only 'message' changed)
+  decode - parsing one STATE back, i.e. the inbound/client-side cost
+"""
+import argparse
+import asyncio
+import timeit
+
+from server import CODECS, JsonCodec, MsgpackCodec, GameState, msgpack, orjson
+
+
+def build_table(players):
+    table = GameState('bench')
+    for i in range(players):
+        table.add_player(f'session-{i:04d}', f'Player{i}')
+    table.deal_all()
+    for sid in list(table.undecided)[::2]:
+        table.handle_action(sid, 'PASS', {})
+    return table
+
+
+def available_codecs():
+    codecs = [('json (stdlib)', JsonCodec(fast=False))]
+    if orjson is not None:
+        codecs.append(('json (orjson)', CODECS['json']))
+    codecs.append(('msgpack (pure)', MsgpackCodec(fast=False)))
+    if msgpack is not None:
+        codecs.append(('msgpack (lib)', CODECS['msgpack']))
+    return codecs
+
+
+def micros(fn, iterations):
+    return min(timeit.repeat(fn, number=iterations, repeat=3)) / iterations * 1e6
+
+
+def bench(players, iterations):
+    table = build_table(players)
+    sid = next(iter(table.players))
+    print(f"\n{players} players")
+    print(f"{'codec':<16}{'STATE bytes':>12}{'PATCH bytes':>12}{'cold us':>10}{'warm us':>10}"
+          f"{'patch us':>10}{'decode us':>11}")
+
+    for label, codec in available_codecs():
+        table.message = 'Next deal in 3s...'
+        table.last_update_id += 1
+
+        def cold():
+            table._public_id = -1
+            return table.get_state_message(sid, codec=codec)
+
+        state = cold()
+
+        def warm():
+            return table.get_state_message(sid, codec=codec)
+
+        base = table.last_update_id
+        table.client_last_private['ws'] = table.get_private_state(sid)
+        table.message = 'Next deal in 2s...'
+        table.last_update_id += 1
+
+        def patch():
+            table._patch_fragments.clear()
+            return table.get_update_message('ws', sid, base, codec)
+
+        patch_message = patch()
+
+        def decode():
+            return codec.loads(state)
+
+        size = lambda m: len(m.encode('utf-8')) if isinstance(m, str) else len(m)
+        print(f"{label:<16}{size(state):>12}{size(patch_message):>12}"
+              f"{micros(cold, iterations):>10.1f}{micros(warm, iterations):>10.1f}"
+              f"{micros(patch, iterations):>10.1f}{micros(decode, iterations):>11.1f}")
+
+
+async def main(args):
+    # deal_all schedules timers, so the table needs a running loop
+    for players in (int(n) for n in args.players.split(',')):
+        bench(players, args.iterations)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', default='8,50')
+    parser.add_argument('--iterations', type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,376 @@
+"""Load generator for the Shoot the Gate server.
+
+    python loadtest.py http --url http://127.0.0.1:8000 --pages 2000 --concurrency 200
+    python loadtest.py ws --spawn --clients 2000 --per-table 6 --duration 60
+
+`http` simulates cold page loads: each load opens a fresh connection and
+fetches index.html, app.js and style.css over keep-alive with gzip
+accepted and no cache validators, like a first-time visitor's browser.
+
+`ws` seats bot players at the game server. Each bot JOINs, keeps the
+STATE/PATCH stream applied like app.js does, and answers every gate with
+SHOOT, SHOOT_SPECIAL or PASS inside the 5-second decision window; now and
+then it drops its connection and resumes the session. It reports
+action-to-state latency (ACTION sent until the first update showing the
+decision), inbound messages/s and the server's CPU and RSS, read from
+/proc for --spawn or --pid. With --min-rate / --max-p99 it exits non-zero
+when a run falls short, so it can gate throughput regressions.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+import websockets
+
+PAGE_ASSETS = ('/', '/app.js', '/style.css')
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+# --- HTTP: cold page loads ---
+
+async def _http_get(reader, writer, host, path):
+    """One keep-alive GET; returns (status, body bytes read)."""
+    writer.write((f'GET {path} HTTP/1.1\r\nHost: {host}\r\n'
+                  'Accept-Encoding: gzip, br\r\nConnection: keep-alive\r\n\r\n').encode('latin-1'))
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    length = 0
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status, length
+
+
+async def _page_load(host, port):
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    total = 0
+    try:
+        for path in PAGE_ASSETS:
+            status, length = await _http_get(reader, writer, host, path)
+            if status != 200:
+                raise RuntimeError(f'{path}: HTTP {status}')
+            total += length
+    finally:
+        writer.close()
+    return time.perf_counter() - started, total
+
+
+async def run_http(args):
+    parts = urlsplit(args.url)
+    host, port = parts.hostname, parts.port or 80
+    latencies = []
+    errors = 0
+    transferred = 0
+    remaining = args.pages
+
+    async def worker():
+        nonlocal errors, transferred, remaining
+        while remaining > 0:
+            remaining -= 1
+            try:
+                elapsed, size = await _page_load(host, port)
+            except (OSError, RuntimeError, asyncio.IncompleteReadError) as e:
+                errors += 1
+                if errors <= 5:
+                    print(f'page load failed: {e!r}')
+                continue
+            latencies.append(elapsed)
+            transferred += size
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    wall = time.perf_counter() - started
+
+    done = len(latencies)
+    print(f'{done} cold page loads ({len(PAGE_ASSETS)} assets each) in {wall:.2f}s '
+          f'with {args.concurrency} concurrent, {errors} errors')
+    print(f'throughput    {done / wall:,.0f} pages/s, {transferred / wall / 1024:,.0f} KiB/s '
+          f'({transferred / max(done, 1):,.0f} bytes/page)')
+    print(f'latency       p50 {percentile(latencies, 50) * 1000:.1f}ms  '
+          f'p90 {percentile(latencies, 90) * 1000:.1f}ms  p99 {percentile(latencies, 99) * 1000:.1f}ms')
+    return errors == 0
+
+
+# --- WS: simulated players ---
+
+DECIDING = ('SHOOTING', 'SHOOTING_SPECIAL')
+
+
+class ProcessSampler:
+    """CPU time and RSS of a server process and its children, from /proc."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.tick = os.sysconf('SC_CLK_TCK')
+        self.peak_rss = 0
+        self._cpu_start = self._wall_start = None
+
+    def _pids(self):
+        pids = [self.pid]
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                try:
+                    with open(f'/proc/{entry}/stat') as f:
+                        if int(f.read().rsplit(')', 1)[1].split()[1]) == self.pid:
+                            pids.append(int(entry))
+                except (OSError, IndexError, ValueError):
+                    pass
+        return pids
+
+    def _read(self):
+        cpu = rss = 0
+        for pid in self._pids():
+            try:
+                with open(f'/proc/{pid}/stat') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+                cpu += (int(fields[11]) + int(fields[12])) / self.tick  # utime + stime
+                with open(f'/proc/{pid}/status') as f:
+                    for line in f:
+                        if line.startswith('VmRSS:'):
+                            rss += int(line.split()[1]) * 1024
+            except (OSError, IndexError, ValueError):
+                pass
+        self.peak_rss = max(self.peak_rss, rss)
+        return cpu, rss
+
+    def start(self):
+        self._cpu_start, _ = self._read()
+        self._wall_start = time.perf_counter()
+
+    def sample(self):
+        return self._read()[1]
+
+    def cpu_percent(self):
+        cpu, _ = self._read()
+        return (cpu - self._cpu_start) / (time.perf_counter() - self._wall_start) * 100
+
+
+class Bot:
+    """One seated player: mirrors the table state and acts on each gate."""
+
+    def __init__(self, index, table, args, stats):
+        self.index = index
+        self.table = table
+        self.args = args
+        self.stats = stats
+        self.rng = random.Random(index)
+        self.state = None
+        self.token = None
+        self.url = None
+        self.deciding = False  # this gate already has a decision scheduled
+        self.sent_at = None  # perf_counter of the ACTION awaiting its state
+        self.seq = 0
+
+    async def run(self, url, stop_at):
+        self.url = url
+        while time.perf_counter() < stop_at:
+            try:
+                async with websockets.connect(self.url, max_queue=None, open_timeout=30) as ws:
+                    await self._play(ws, stop_at)
+            except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as e:
+                self.stats['errors'] += 1
+                if self.stats['errors'] <= 5:
+                    print(f'bot {self.index}: {e!r}')
+                await asyncio.sleep(1)
+            self.state = None
+            self.sent_at = None
+
+    async def _play(self, ws, stop_at):
+        join = {'type': 'JOIN', 'name': f'bot{self.index}', 'ante': 10, 'table': self.table, 'codec': 'json'}
+        if self.token:
+            join['resume'] = self.token
+            self.stats['resumes'] += 1
+        await ws.send(json.dumps(join))
+        while True:
+            remaining = stop_at - time.perf_counter()
+            if remaining <= 0:
+                return
+            try:
+                raw = await asyncio.wait_for(ws.recv(), remaining)
+            except asyncio.TimeoutError:
+                return
+            self.stats['messages'] += 1
+            self.stats['bytes'] += len(raw)
+            data = json.loads(raw)
+            kind = data['type']
+            if kind == 'WELCOME':
+                self.token = data['token']
+            elif kind == 'STATE':
+                self.state = data['state']
+            elif kind == 'PATCH':
+                if self.state is None or self.state['update_id'] != data['base_id']:
+                    await ws.send('{"type": "RESYNC"}')
+                    continue
+                self.state.update(data['set'])
+                self.state['update_id'] = data['update_id']
+            elif kind == 'REDIRECT':
+                # Worker mode: reconnect straight to the worker that owns the table
+                self.url = f'ws://{urlsplit(self.url).hostname}:{data["port"]}'
+                return
+            else:
+                continue
+            if kind in ('STATE', 'PATCH') and await self._on_state(ws):
+                return  # churn: drop the connection, run() resumes the session
+
+    async def _on_state(self, ws):
+        state = self.state
+        phase = state['my_phase']
+        if self.sent_at is not None and phase not in DECIDING:
+            self.stats['latencies'].append(time.perf_counter() - self.sent_at)
+            self.sent_at = None
+            if self.rng.random() < self.args.churn:
+                self.stats['disconnects'] += 1
+                return True
+        if state['round_phase'] == 'WAITING' and self.index % self.args.per_table == 0:
+            await ws.send('{"type": "ACTION", "action": "DEAL", "payload": {}}')
+        elif phase not in DECIDING:
+            self.deciding = False
+        elif not self.deciding:
+            self.deciding = True
+            asyncio.get_running_loop().call_later(
+                self.rng.uniform(0.1, self.args.think), lambda: asyncio.ensure_future(self._act(ws, phase)))
+        return False
+
+    async def _act(self, ws, phase):
+        state = self.state
+        if state is None or state['my_phase'] != phase:
+            return  # resolved or timed out meanwhile
+        cap = max(1, min(state['pot'], next((p['balance'] for p in state['players']
+                                             if p['name'] == f'bot{self.index}'), 1)))
+        roll = self.rng.random()
+        if roll < 0.25:
+            action, payload = 'PASS', {}
+        elif phase == 'SHOOTING_SPECIAL':
+            action, payload = 'SHOOT_SPECIAL', {'bet': self.rng.randint(1, cap), 'choice': self.rng.choice(('high', 'low'))}
+        else:
+            action, payload = 'SHOOT', {'bet': self.rng.randint(1, cap)}
+        self.seq += 1
+        self.sent_at = time.perf_counter()
+        self.stats['actions'] += 1
+        try:
+            await ws.send(json.dumps({'type': 'ACTION', 'action': action, 'payload': payload, 'seq': self.seq}))
+        except websockets.exceptions.ConnectionClosed:
+            self.sent_at = None
+
+
+def _spawn_server(port, workers):
+    # No event log or hand history: bots stay out of data/ and disk cost stays out of the numbers
+    env = dict(os.environ, WS_PORT=str(port), PORT=str(port + 100), WORKERS=str(workers),
+               EVENT_LOG_DIR='', HISTORY_DB='')
+    server = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+    return subprocess.Popen([sys.executable, server], env=env, stdout=subprocess.DEVNULL)
+
+
+async def run_ws(args):
+    # Thousands of sockets need more file descriptors than the default soft limit
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    server = None
+    pid = args.pid
+    url = args.url
+    if args.spawn:
+        port = urlsplit(url).port or 8765
+        server = _spawn_server(port, args.workers)
+        pid = server.pid
+        await asyncio.sleep(1.5)
+    sampler = ProcessSampler(pid) if pid else None
+
+    stats = {'messages': 0, 'bytes': 0, 'actions': 0, 'errors': 0, 'disconnects': 0, 'resumes': 0, 'latencies': []}
+    bots = [Bot(i, f'load-{i // args.per_table}', args, stats) for i in range(args.clients)]
+    ramp = args.clients / args.ramp
+    stop_at = time.perf_counter() + ramp + args.duration
+    tasks = []
+    try:
+        for bot in bots:
+            tasks.append(asyncio.ensure_future(bot.run(url, stop_at)))
+            await asyncio.sleep(1 / args.ramp)
+
+        # Measure the steady state only, once every bot is connected
+        stats['latencies'].clear()
+        messages, transferred = stats['messages'], stats['bytes']
+        if sampler:
+            sampler.start()
+        started = time.perf_counter()
+        while time.perf_counter() < stop_at:
+            await asyncio.sleep(1)
+            if sampler:
+                sampler.sample()
+        wall = time.perf_counter() - started
+        cpu = sampler.cpu_percent() if sampler else None
+        await asyncio.gather(*tasks)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    latencies = stats['latencies']
+    rate = (stats['messages'] - messages) / wall
+    p99 = percentile(latencies, 99) * 1000
+    print(f"{args.clients} bots on {-(-args.clients // args.per_table)} tables for {wall:.0f}s, "
+          f"{stats['errors']} errors, {stats['disconnects']} disconnects, {stats['resumes']} resumes")
+    print(f"actions       {stats['actions']:,} sent, action-to-state p50 {percentile(latencies, 50) * 1000:.1f}ms  "
+          f"p99 {p99:.1f}ms  ({len(latencies):,} samples)")
+    print(f"messages      {rate:,.0f} msgs/s in, {(stats['bytes'] - transferred) / wall / 1024:,.0f} KiB/s")
+    if sampler:
+        print(f"server        cpu {cpu:.0f}% of one core, peak rss {sampler.peak_rss / 2 ** 20:.0f} MiB")
+
+    ok = stats['errors'] <= args.max_errors
+    if args.min_rate and rate < args.min_rate:
+        print(f'FAIL: {rate:,.0f} msgs/s below --min-rate {args.min_rate:,.0f}')
+        ok = False
+    if args.max_p99 and p99 > args.max_p99:
+        print(f'FAIL: p99 {p99:.1f}ms above --max-p99 {args.max_p99:g}ms')
+        ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest='mode', required=True)
+
+    http = sub.add_parser('http', help='cold page loads against the static file server')
+    http.add_argument('--url', default='http://127.0.0.1:8000')
+    http.add_argument('--pages', type=int, default=2000)
+    http.add_argument('--concurrency', type=int, default=100)
+
+    ws = sub.add_parser('ws', help='bot players against the websocket game server')
+    ws.add_argument('--url', default='ws://127.0.0.1:8765')
+    ws.add_argument('--spawn', action='store_true', help='start server.py on --url\'s port for the run')
+    ws.add_argument('--workers', type=int, default=1, help='WORKERS for the --spawn server')
+    ws.add_argument('--pid', type=int, help='sample CPU/RSS of an already running server')
+    ws.add_argument('--clients', type=int, default=500)
+    ws.add_argument('--per-table', type=int, default=6)
+    ws.add_argument('--duration', type=float, default=30, help='seconds measured after ramp-up')
+    ws.add_argument('--ramp', type=float, default=500, help='new connections per second')
+    ws.add_argument('--think', type=float, default=3.0, help='max seconds a bot takes to decide (< 5)')
+    ws.add_argument('--churn', type=float, default=0.02, help='chance a bot disconnects after acting')
+    ws.add_argument('--min-rate', type=float, help='fail below this many inbound msgs/s')
+    ws.add_argument('--max-p99', type=float, help='fail above this p99 action-to-state, in ms')
+    ws.add_argument('--max-errors', type=int, default=0)
+
+    args = parser.parse_args()
+    ok = asyncio.run(run_http(args) if args.mode == 'http' else run_ws(args))
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,34 +1,52 @@
 import asyncio
+import bisect
+import collections
+import concurrent.futures
+import cProfile
+import email.utils
+import functools
+import gzip
+import hashlib
+import heapq
+import hmac
+import io
 import json
+import math
+import multiprocessing
+import pstats
+import queue
 import random
-import http.server
-import socketserver
-import websockets
+import secrets
+import signal
+import sqlite3
+import struct
 import threading
+import websockets
 import os
 import time
+import tracemalloc
+import zlib
 
 # --- Game Logic (Server Side) ---
 
+# Cards are ints 0-51: suit = card // 13, rank = card % 13 (A..K).
+# Clients decode the same way, so a card costs 1-2 bytes on the wire.
+SUITS = ('♠', '♥', '♦', '♣')
+FULL_DECK = tuple(range(52))
+CARD_VALUE = tuple(c % 13 + 1 for c in FULL_DECK)  # A=1 .. K=13
+CARD_SUIT = tuple(SUITS[c // 13] for c in FULL_DECK)
+CARD_COLOR = tuple('red' if CARD_SUIT[c] in ('♥', '♦') else 'black' for c in FULL_DECK)
+
+
 class Deck:
     def __init__(self):
-        self.suits = ['♠', '♥', '♦', '♣']
-        self.values = [
-            {'val': 1, 'display': 'A'}, {'val': 2, 'display': '2'}, {'val': 3, 'display': '3'},
-            {'val': 4, 'display': '4'}, {'val': 5, 'display': '5'}, {'val': 6, 'display': '6'},
-            {'val': 7, 'display': '7'}, {'val': 8, 'display': '8'}, {'val': 9, 'display': '9'},
-            {'val': 10, 'display': '10'}, {'val': 11, 'display': 'J'}, {'val': 12, 'display': 'Q'},
-            {'val': 13, 'display': 'K'}
-        ]
         self.cards = []
+        self.rank_left = []  # rank index (value - 1) -> copies still in the shoe
         self.reset()
 
     def reset(self):
-        self.cards = []
-        for suit in self.suits:
-            for v in self.values:
-                color = 'red' if suit in ['♥', '♦'] else 'black'
-                self.cards.append({**v, 'suit': suit, 'color': color})
+        self.cards = list(FULL_DECK)
+        self.rank_left = [4] * 13
         self.shuffle()
 
     def shuffle(self):
@@ -37,107 +55,663 @@ class Deck:
     def draw(self):
         if not self.cards:
             self.reset()
-        return self.cards.pop()
+        card = self.cards.pop()
+        self.rank_left[card % 13] -= 1
+        return card
+
+
+class GateOdds:
+    """Exact outcome odds for any gate against the cards left in a shoe.
+
+    Built once per deal from Deck.rank_left (kept current on every draw),
+    so each seat's lookup is a couple of prefix-sum subtractions.
+    """
+
+    def __init__(self, rank_left):
+        counts = list(rank_left)
+        if not any(counts):
+            counts = [4] * 13  # next draw reshuffles a full shoe
+        self.counts = counts
+        self.below = [0]  # below[i] = cards with rank index < i
+        for n in counts:
+            self.below.append(self.below[-1] + n)
+        self.total = self.below[-1]
+
+    def gate(self, left, right):
+        """Odds for a normal gate: win strictly between, hit a post, or miss."""
+        lo, hi = sorted((CARD_VALUE[left] - 1, CARD_VALUE[right] - 1))
+        win = self.below[hi] - self.below[lo + 1]
+        post = self.counts[lo] + self.counts[hi]
+        miss = self.total - win - post
+        return {
+            'win': round(win / self.total, 4),
+            'post': round(post / self.total, 4),
+            'miss': round(miss / self.total, 4),
+            # Per $1 bet: win +1, post -2, miss -1
+            'ev': round((win - 2 * post - miss) / self.total, 4)
+        }
+
+    def pair(self, card):
+        """Odds for a pair gate: higher, lower, or a triple post."""
+        g = CARD_VALUE[card] - 1
+        low = self.below[g]
+        post = self.counts[g]
+        high = self.total - low - post
+        return {
+            'high': round(high / self.total, 4),
+            'low': round(low / self.total, 4),
+            'post': round(post / self.total, 4),
+            # Per $1 bet on each side: win +1, triple post -2, other side -1
+            'ev_high': round((high - 2 * post - low) / self.total, 4),
+            'ev_low': round((low - 2 * post - high) / self.total, 4)
+        }
+
+# --- Wire Codecs ---
+# STATE and PATCH are the hot path, so they go through a codec picked at
+# JOIN: JSON text (orjson when installed) or compact MessagePack binary
+# frames. Codecs encode field "fragments" that can be spliced together, so
+# the public part of a state is encoded once and shared by every socket.
+# WELCOME/ACK/ERROR stay JSON text whatever the codec.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class JsonCodec:
+    name = 'json'
+    binary = False
+
+    def __init__(self, fast=True):
+        if fast and orjson is not None:
+            self.backend = 'orjson'
+            self.dumps = lambda obj: orjson.dumps(obj).decode()
+            self.loads = orjson.loads
+        else:
+            self.backend = 'json'
+            self.dumps = lambda obj: json.dumps(obj, separators=(',', ':'))
+            self.loads = json.loads
+
+    def fragment(self, fields):
+        """The key/value pairs of fields, ready to be spliced into an object."""
+        return self.dumps(fields)[1:-1]
+
+    def message(self, head, key, fragments):
+        """Encode {**head, key: {fragments...}}."""
+        inner = ','.join(f for f in fragments if f)
+        return f'{self.dumps(head)[:-1]},"{key}":{{{inner}}}}}'
+
+
+def _mp_map_header(n):
+    if n < 16:
+        return bytes((0x80 | n,))
+    if n < 0x10000:
+        return b'\xde' + struct.pack('>H', n)
+    return b'\xdf' + struct.pack('>I', n)
+
+
+def _mp_pack(obj, out):
+    """Pure-Python MessagePack encoder for the types our messages use."""
+    if obj is None:
+        out.append(b'\xc0')
+    elif obj is True:
+        out.append(b'\xc3')
+    elif obj is False:
+        out.append(b'\xc2')
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(bytes((obj,)))
+        elif -32 <= obj < 0:
+            out.append(struct.pack('b', obj))
+        elif 0 <= obj <= 0xff:
+            out.append(b'\xcc' + struct.pack('>B', obj))
+        elif 0 <= obj <= 0xffff:
+            out.append(b'\xcd' + struct.pack('>H', obj))
+        elif 0 <= obj <= 0xffffffff:
+            out.append(b'\xce' + struct.pack('>I', obj))
+        elif obj >= 0:
+            out.append(b'\xcf' + struct.pack('>Q', obj))
+        elif obj >= -0x80:
+            out.append(b'\xd0' + struct.pack('>b', obj))
+        elif obj >= -0x8000:
+            out.append(b'\xd1' + struct.pack('>h', obj))
+        elif obj >= -0x80000000:
+            out.append(b'\xd2' + struct.pack('>i', obj))
+        else:
+            out.append(b'\xd3' + struct.pack('>q', obj))
+    elif isinstance(obj, float):
+        out.append(b'\xcb' + struct.pack('>d', obj))
+    elif isinstance(obj, str):
+        data = obj.encode('utf-8')
+        n = len(data)
+        if n < 32:
+            out.append(bytes((0xa0 | n,)))
+        elif n < 0x100:
+            out.append(b'\xd9' + struct.pack('>B', n))
+        elif n < 0x10000:
+            out.append(b'\xda' + struct.pack('>H', n))
+        else:
+            out.append(b'\xdb' + struct.pack('>I', n))
+        out.append(data)
+    elif isinstance(obj, (list, tuple)):
+        n = len(obj)
+        if n < 16:
+            out.append(bytes((0x90 | n,)))
+        elif n < 0x10000:
+            out.append(b'\xdc' + struct.pack('>H', n))
+        else:
+            out.append(b'\xdd' + struct.pack('>I', n))
+        for item in obj:
+            _mp_pack(item, out)
+    elif isinstance(obj, dict):
+        out.append(_mp_map_header(len(obj)))
+        for k, v in obj.items():
+            _mp_pack(k, out)
+            _mp_pack(v, out)
+    else:
+        raise TypeError(f"can't MessagePack-encode {type(obj).__name__}")
+
+
+_MP_FIXED = {
+    0xcc: '>B', 0xcd: '>H', 0xce: '>I', 0xcf: '>Q',
+    0xd0: '>b', 0xd1: '>h', 0xd2: '>i', 0xd3: '>q',
+    0xca: '>f', 0xcb: '>d'
+}
+
+
+MP_MAX_DEPTH = 32  # nesting limit for _mp_unpack; our messages are 3-4 levels deep
+
+
+def _mp_unpack(data, i=0, depth=0):
+    """Decode one MessagePack value at data[i:]; returns (value, next index)."""
+    if depth > MP_MAX_DEPTH:
+        raise ValueError("MessagePack value nested too deeply")
+    b = data[i]
+    i += 1
+    if b < 0x80:
+        return b, i
+    if b >= 0xe0:
+        return b - 0x100, i
+    if 0xa0 <= b <= 0xbf:
+        n = b & 0x1f
+        return data[i:i + n].decode('utf-8'), i + n
+    if 0x90 <= b <= 0x9f:
+        n, kind = b & 0x0f, 'array'
+    elif 0x80 <= b <= 0x8f:
+        n, kind = b & 0x0f, 'map'
+    elif b == 0xc0:
+        return None, i
+    elif b == 0xc2:
+        return False, i
+    elif b == 0xc3:
+        return True, i
+    elif b in _MP_FIXED:
+        fmt = _MP_FIXED[b]
+        return struct.unpack_from(fmt, data, i)[0], i + struct.calcsize(fmt)
+    elif b in (0xd9, 0xda, 0xdb, 0xc4, 0xc5, 0xc6):
+        fmt = {0xd9: '>B', 0xda: '>H', 0xdb: '>I', 0xc4: '>B', 0xc5: '>H', 0xc6: '>I'}[b]
+        n = struct.unpack_from(fmt, data, i)[0]
+        i += struct.calcsize(fmt)
+        raw = bytes(data[i:i + n])
+        return (raw.decode('utf-8') if b >= 0xd9 else raw), i + n
+    elif b in (0xdc, 0xdd):
+        fmt = '>H' if b == 0xdc else '>I'
+        n, kind = struct.unpack_from(fmt, data, i)[0], 'array'
+        i += struct.calcsize(fmt)
+    elif b in (0xde, 0xdf):
+        fmt = '>H' if b == 0xde else '>I'
+        n, kind = struct.unpack_from(fmt, data, i)[0], 'map'
+        i += struct.calcsize(fmt)
+    else:
+        raise ValueError(f"unsupported MessagePack type byte 0x{b:02x}")
+
+    if kind == 'array':
+        items = []
+        for _ in range(n):
+            value, i = _mp_unpack(data, i, depth + 1)
+            items.append(value)
+        return items, i
+    result = {}
+    for _ in range(n):
+        key, i = _mp_unpack(data, i, depth + 1)
+        result[key], i = _mp_unpack(data, i, depth + 1)
+    return result, i
+
+
+class MsgpackCodec:
+    name = 'msgpack'
+    binary = True
+
+    def __init__(self, fast=True):
+        if fast and msgpack is not None:
+            self.backend = 'msgpack'
+            self.dumps = msgpack.packb
+            self.loads = msgpack.unpackb
+        else:
+            self.backend = 'pure-python'
+            self.dumps = self._dumps
+            self.loads = lambda data: _mp_unpack(data)[0]
+
+    @staticmethod
+    def _dumps(obj):
+        out = []
+        _mp_pack(obj, out)
+        return b''.join(out)
+
+    def fragment(self, fields):
+        """(pair count, encoded key/value pairs) ready to be spliced into a map."""
+        n = len(fields)
+        if not n:
+            return (0, b'')
+        encoded = self.dumps(fields)
+        return (n, encoded[len(_mp_map_header(n)):])
+
+    def message(self, head, key, fragments):
+        """Encode {**head, key: {fragments...}}."""
+        count = sum(n for n, _ in fragments)
+        head_n, head_pairs = self.fragment(head)
+        return b''.join((
+            _mp_map_header(head_n + 1), head_pairs,
+            self.dumps(key), _mp_map_header(count), *(pairs for _, pairs in fragments)
+        ))
+
+
+JSON_CODEC = JsonCodec()
+CODECS = {'json': JSON_CODEC, 'msgpack': MsgpackCodec()}
+# Only offer MessagePack at JOIN with the C-backed package: the pure-Python
+# encoder is several times slower than JSON (see bench_codec.py).
+NEGOTIABLE_CODECS = {'json': JSON_CODEC}
+if msgpack is not None:
+    NEGOTIABLE_CODECS['msgpack'] = CODECS['msgpack']
+
+
+def decode_inbound(message):
+    """Text frames are JSON, binary frames are MessagePack (only if it can be negotiated)."""
+    if isinstance(message, str):
+        return JSON_CODEC.loads(message)
+    if 'msgpack' not in NEGOTIABLE_CODECS:
+        return None  # counted as malformed and dropped
+    return NEGOTIABLE_CODECS['msgpack'].loads(message)
+
+
+# --- Timer Scheduler ---
+
+SCHEDULER_TICK = 0.05  # deadlines are rounded up to this grid so they fire in batches
+
+
+class Timer:
+    """Handle for a scheduled callback; cancel() just marks it, the heap drops it lazily."""
+    __slots__ = ('when', 'callback', 'cancelled')
+
+    def __init__(self, when, callback):
+        self.when = when
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        self.callback = None  # don't keep what the callback closes over (a socket, a table) alive in the heap
+
+
+class Scheduler:
+    """One deadline heap for every table's decision and countdown timers.
+
+    A single task sleeps until the earliest deadline, runs every callback
+    that is due in that tick, then marks each table a callback returned
+    dirty for its flusher. Scheduling or cancelling a timer creates no tasks.
+    """
+
+    def __init__(self, tick=SCHEDULER_TICK):
+        self.tick = tick
+        self._heap = []  # (when, seq, Timer)
+        self._seq = 0
+        self._task = None
+        self._waiter = None  # future the run loop sleeps on
+        self._next_wake = float('inf')
+
+    def call_later(self, delay, callback):
+        """Run callback() after delay seconds; it returns a table to broadcast, or None."""
+        return self.call_at(asyncio.get_event_loop().time() + delay, callback)
+
+    def call_at(self, when, callback):
+        """Run callback() at loop time `when`, rounded up to the next tick."""
+        loop = asyncio.get_event_loop()
+        when = math.ceil(round(when / self.tick, 6)) * self.tick
+        timer = Timer(when, callback)
+        self._seq += 1
+        heapq.heappush(self._heap, (when, self._seq, timer))
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+        elif when < self._next_wake:
+            self._wake()
+        return timer
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def _run_due(self, now):
+        """Pop and run every timer due by now; returns the tables that changed."""
+        touched = set()
+        while self._heap and self._heap[0][0] <= now:
+            timer = heapq.heappop(self._heap)[2]
+            if timer.cancelled:
+                continue
+            try:
+                table = timer.callback()
+            except Exception as e:
+                print(f"Timer callback failed: {e!r}")
+                continue
+            if table is not None:
+                touched.add(table)
+        return touched
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            for table in self._run_due(loop.time()):
+                table.mark_dirty()
+            self._waiter = loop.create_future()
+            handle = None
+            if self._heap:
+                self._next_wake = self._heap[0][0]
+                handle = loop.call_at(self._next_wake, self._wake)
+            else:
+                self._next_wake = float('inf')
+            await self._waiter
+            if handle is not None:
+                handle.cancel()
+
+
+scheduler = Scheduler()
+
+EMPTY_CARDS = {'left': None, 'right': None, 'result': None}
+DECIDING_PHASES = ('SHOOTING', 'SHOOTING_SPECIAL')
+
+
+class Player:
+    """One seat at a table: public identity plus this round's private state."""
+    __slots__ = ('id', 'name', 'balance', 'connected', 'cards', 'phase', 'result_msg', 'bet', 'choice', 'odds')
+
+    def __init__(self, session_id, name, balance=1000):
+        self.id = session_id
+        self.name = name
+        self.balance = balance
+        self.connected = True
+        self.cards = dict(EMPTY_CARDS)
+        self.phase = 'IDLE'  # IDLE | SHOOTING | SHOOTING_SPECIAL | BET_PLACED | DONE
+        self.result_msg = ''
+        self.bet = 0
+        self.choice = None  # None for normal gates, 'high'/'low' for pairs
+        self.odds = None  # GateOdds.gate()/pair() hint for this round's gate
+
+SHOW_ODDS = os.environ.get("ODDS_HINTS", "0") == "1"  # send per-seat odds in private state
+PATCH_HISTORY = 16  # public snapshots kept as PATCH bases per table
 
 class GameState:
-    def __init__(self):
+    def __init__(self, table_id='main'):
+        self.table_id = table_id
         self.deck = Deck()
-        self.players = []  # [{id, name, balance, connected}]
+        self.players = {}  # session_id -> Player, in join order
         self.pot = 0
         self.ante = 10
         self.round_phase = 'WAITING'  # WAITING | IN_ROUND | COUNTDOWN
-        self.player_states = {}  # session_id -> {cards, phase, result_msg, bet, choice}
+        self.undecided = set()  # session_ids still SHOOTING this round
+        self.odds = None  # GateOdds for the shoe as it stood after the last deal
+        self.show_odds = SHOW_ODDS
+        self.journal = None  # EventLog recording every state transition, if durable
+        self.reserved = {}  # session_id -> Player recovered from the event log, until reclaimed
+        self.seat_keys = {}  # session_id -> seat_key() of the seat's resume token, for reclaiming after a restart
+        self.held = {}  # session_id -> Timer releasing a disconnected seat after RESUME_GRACE
         self.message = "Waiting for players..."
         self.last_update_id = 0
-        self.auto_deal_task = None  # asyncio.Task for auto-deal countdown
+        self.auto_deal_timer = None  # scheduler Timer for the next countdown tick
         self.countdown_seconds = 0
-        self.decision_timer_task = None  # asyncio.Task for 5s decision timer
+        self.decision_timer = None  # scheduler Timer for the 5s decision deadline
         self.decision_deadline = 0  # timestamp when decisions must be made
-
-    def add_player(self, session_id, name):
-        for p in self.players:
-            if p['id'] == session_id:
-                return p
-
-        player = {
-            'id': session_id,
-            'name': name,
-            'balance': 1000,
-            'connected': True
-        }
-        self.players.append(player)
-        self.player_states[session_id] = {
-            'cards': {'left': None, 'right': None, 'result': None},
-            'phase': 'IDLE',
-            'result_msg': '',
-            'bet': 0,
-            'choice': None
-        }
+        self.clients = {}  # websocket -> ClientOutbox (sockets seated at this table)
+        self.client_last_update_id = {}  # websocket -> last sent update_id
+        self._dirty = None  # asyncio.Event set when state needs broadcasting
+        self._first_dirty = 0  # loop time of the oldest unsent change
+        self._last_dirty = 0  # loop time of the newest unsent change
+        self._flusher = None  # asyncio.Task running _flush_loop
+        self.client_last_private = {}  # websocket -> private fragment last sent (PATCH base)
+        self._public_id = -1  # update_id the cached public state belongs to
+        self._public = None
+        self._public_fragments = {}  # codec name -> encoded public state for the current update
+        self._public_history = {}  # update_id -> public state, for PATCH bases
+        self._patch_fragments = {}  # (codec name, base update_id) -> encoded public diff
+        self.spectators = {}  # websocket -> codec, for watchers who get the shared public STATE
+        self._spectator_frames = {}  # codec name -> encoded public-only STATE for the current update
+        self._spectator_sent_id = -1
+        self._spectator_wake = None
+        self._spectator_task = None
+
+    def add_player(self, session_id, name, key=None):
+        player = self.players.get(session_id)
+        if player is not None:
+            return player
+
+        balance = 1000
+        recovered = self.reserved.pop(session_id, None)
+        if recovered is not None:
+            # Seat restored after a restart (see find_reserved): the balance comes back
+            balance = recovered.balance
+
+        player = Player(session_id, name, balance)
+        self.players[session_id] = player
+        if key is not None:
+            self.seat_keys[session_id] = key
         self.message = f"{name} joined the game."
         self.last_update_id += 1
+        self._log('join', sid=session_id, name=name, balance=balance, key=self.seat_keys.get(session_id))
         return player
 
-    def remove_player(self, session_id):
-        idx = -1
-        for i, p in enumerate(self.players):
-            if p['id'] == session_id:
-                idx = i
-                break
+    def find_reserved(self, key):
+        """Session id of the recovered seat whose resume token hashes to key, or None."""
+        for session_id in self.reserved:
+            if hmac.compare_digest(self.seat_keys.get(session_id) or '', key):
+                return session_id
+        return None
 
-        if idx != -1:
-            removed = self.players.pop(idx)
-            if session_id in self.player_states:
-                del self.player_states[session_id]
-            self.message = f"{removed['name']} disconnected."
+    def remove_player(self, session_id):
+        removed = self.players.pop(session_id, None)
+        if removed is not None:
+            self.seat_keys.pop(session_id, None)
+            self._log('leave', sid=session_id)
+            self.undecided.discard(session_id)
+            self.message = f"{removed.name} disconnected."
             self.last_update_id += 1
             # Cancel auto-deal if in countdown and no players left
             if self.round_phase == 'COUNTDOWN':
                 if not self.players:
-                    if self.auto_deal_task and not self.auto_deal_task.done():
-                        self.auto_deal_task.cancel()
-                        self.auto_deal_task = None
-                    self.round_phase = 'WAITING'
+                    self._cancel_auto_deal()
             # Check if round completes after removal
             elif self.round_phase == 'IN_ROUND':
                 self._check_all_bets_placed()
 
-    def get_state_for_player(self, session_id):
-        ps = self.player_states.get(session_id, {
-            'cards': {'left': None, 'right': None, 'result': None},
-            'phase': 'IDLE',
-            'result_msg': '',
-            'bet': 0,
-            'choice': None
-        })
-
-        # Build public player list with status
-        players_public = []
-        for p in self.players:
-            sid = p['id']
-            pstate = self.player_states.get(sid, {})
-            players_public.append({
-                'id': sid,
-                'name': p['name'],
-                'balance': p['balance'],
-                'phase': pstate.get('phase', 'IDLE'),
-                'result_msg': pstate.get('result_msg', '')
-            })
+    def hold_seat(self, session_id):
+        """Keep a disconnected player's seat for RESUME_GRACE seconds. Nothing is
+        broadcast: to the rest of the table the player is just slow to act."""
+        player = self.players.get(session_id)
+        if player is None:
+            return
+        player.connected = False
+        self.held[session_id] = scheduler.call_later(RESUME_GRACE, lambda: self._release_seat(session_id))
+
+    def resume_seat(self, session_id):
+        """Reattach a held seat; returns the Player, or None if it was released."""
+        timer = self.held.pop(session_id, None)
+        if timer is not None:
+            timer.cancel()
+        player = self.players.get(session_id)
+        if player is not None:
+            player.connected = True
+        return player
+
+    def _release_seat(self, session_id):
+        """Scheduler callback: the grace period ran out, give the seat up."""
+        self.held.pop(session_id, None)
+        end_session(session_id)
+        self.remove_player(session_id)
+        if self.is_empty():
+            tables.discard_if_empty(self.table_id)
+            return None
+        return self
+
+    def get_public_state(self):
+        """State shared by everyone at the table (no cards, no private phase)."""
+        players_public = [{
+            'id': p.id,
+            'name': p.name,
+            'balance': p.balance,
+            'phase': p.phase,
+            'result_msg': p.result_msg
+        } for p in self.players.values()]
 
         return {
             'players': players_public,
             'pot': self.pot,
             'round_phase': self.round_phase,
-            'my_cards': ps.get('cards', {'left': None, 'right': None, 'result': None}),
-            'my_phase': ps.get('phase', 'IDLE'),
-            'my_result_msg': ps.get('result_msg', ''),
             'message': self.message,
             'ante': self.ante,
             'update_id': self.last_update_id,
             'decision_deadline': self.decision_deadline
         }
 
+    def get_private_state(self, session_id):
+        """The small per-player fragment layered on top of the public state."""
+        p = self.players.get(session_id)
+        if p is None:
+            return {'my_cards': dict(EMPTY_CARDS), 'my_phase': 'IDLE', 'my_result_msg': ''}
+        private = {
+            # Copy: the result card is filled into this dict in place
+            'my_cards': dict(p.cards),
+            'my_phase': p.phase,
+            'my_result_msg': p.result_msg
+        }
+        if self.show_odds:
+            private['my_odds'] = p.odds if p.phase in DECIDING_PHASES else None
+        return private
+
+    def get_state_for_player(self, session_id):
+        state = self.get_public_state()
+        state.update(self.get_private_state(session_id))
+        return state
+
+    def _current_public(self):
+        """Public state for last_update_id, built once per update."""
+        if self._public_id != self.last_update_id:
+            public = self.get_public_state()
+            self._public = public
+            self._public_id = self.last_update_id
+            self._public_fragments = {}
+            self._patch_fragments = {}
+            self._spectator_frames = {}
+            self._public_history[self.last_update_id] = public
+            while len(self._public_history) > PATCH_HISTORY:
+                del self._public_history[next(iter(self._public_history))]
+        return self._public
+
+    def get_state_message(self, session_id, private=None, codec=JSON_CODEC):
+        """Encoded full STATE message for one player.
+
+        The public part is encoded once per update_id and codec and cached;
+        each player only costs encoding their private fragment, spliced into
+        the same STATE object the client has always received.
+        """
+        public_fragment = self._public_fragment(codec)
+        if private is None:
+            private = self.get_private_state(session_id)
+        message = codec.message({'type': 'STATE'}, 'state', (public_fragment, codec.fragment(private)))
+        if metrics is not None:
+            metrics.state_bytes.observe(len(message))
+        return message
+
+    def _public_fragment(self, codec):
+        public = self._current_public()
+        fragment = self._public_fragments.get(codec.name)
+        if fragment is None:
+            fragment = self._public_fragments[codec.name] = codec.fragment(public)
+        return fragment
+
+    def get_spectator_message(self, codec=JSON_CODEC):
+        """Public-only STATE, encoded once per update and codec and shared by
+        every spectator: no private fields, nothing per socket."""
+        fragment = self._public_fragment(codec)
+        message = self._spectator_frames.get(codec.name)
+        if message is None:
+            message = self._spectator_frames[codec.name] = codec.message({'type': 'STATE'}, 'state', (fragment,))
+        return message
+
+    def get_update_message(self, ws, session_id, base_id, codec=JSON_CODEC):
+        """STATE or PATCH for one socket, given the update_id it was last sent.
+
+        A PATCH only carries the top-level fields that changed since
+        base_id; the client applies it if it is still at base_id and asks
+        for a RESYNC otherwise. Sockets without a known base get full STATE.
+        """
+        public = self._current_public()
+        private = self.get_private_state(session_id)
+        base_private = self.client_last_private.get(ws)
+        self.client_last_private[ws] = private
+        base_public = self._public_history.get(base_id)
+        if base_public is None or base_private is None:
+            return self.get_state_message(session_id, private, codec)
+
+        public_fragment = self._patch_fragments.get((codec.name, base_id))
+        if public_fragment is None:
+            changed = {k: v for k, v in public.items() if k != 'update_id' and base_public.get(k) != v}
+            public_fragment = self._patch_fragments[(codec.name, base_id)] = codec.fragment(changed)
+        changed = {k: v for k, v in private.items() if base_private.get(k) != v}
+        head = {'type': 'PATCH', 'base_id': base_id, 'update_id': self.last_update_id}
+        message = codec.message(head, 'set', (public_fragment, codec.fragment(changed)))
+        if metrics is not None:
+            metrics.patch_bytes.observe(len(message))
+        return message
+
+    def forget_client(self, ws):
+        """Drop per-socket send bookkeeping; the next update will be a full STATE."""
+        self.client_last_update_id.pop(ws, None)
+        self.client_last_private.pop(ws, None)
+
     # --- Actions ---
 
+    def admit_action(self, session_id, action_type, payload):
+        """Why an ACTION can't do anything right now, or None if it may change
+        the table. Checked before handle_action, so junk never bumps last_update_id."""
+        player = self.players.get(session_id)
+        if player is None:
+            return 'not seated'
+        if action_type == 'DEAL':
+            return None if self.round_phase == 'WAITING' else 'not waiting for a deal'
+        if action_type not in ('SHOOT', 'SHOOT_SPECIAL', 'PASS'):
+            return 'unknown action'
+        if self.round_phase != 'IN_ROUND' or player.phase not in DECIDING_PHASES:
+            return 'no decision pending'
+        if action_type == 'PASS':
+            return None
+        if action_type != ('SHOOT' if player.phase == 'SHOOTING' else 'SHOOT_SPECIAL'):
+            return 'wrong action for this gate'
+        bet = payload.get('bet') if isinstance(payload, dict) else None
+        if not isinstance(bet, int) or isinstance(bet, bool) or bet <= 0:
+            return 'invalid bet'
+        if bet > self.max_bet(player):
+            return 'bet over limit'
+        if action_type == 'SHOOT_SPECIAL' and payload.get('choice') not in ('high', 'low'):
+            return 'invalid choice'
+        return None
+
+    def max_bet(self, player):
+        """Largest bet a seat may place: the client slider's min(pot, balance), at least 1."""
+        return max(1, min(self.pot if self.pot > 0 else 1, player.balance))
+
     def handle_action(self, session_id, action_type, payload):
         if not self.players:
             return
@@ -145,204 +719,238 @@ class GameState:
         if action_type == 'DEAL':
             if self.round_phase == 'WAITING' and len(self.players) >= 1:
                 # Cancel any pending auto-deal
-                if self.auto_deal_task and not self.auto_deal_task.done():
-                    self.auto_deal_task.cancel()
-                    self.auto_deal_task = None
+                if self.auto_deal_timer:
+                    self.auto_deal_timer.cancel()
+                    self.auto_deal_timer = None
                 self.deal_all()
             return
 
         # Per-player actions
-        ps = self.player_states.get(session_id)
-        if not ps:
-            return
-
-        player = None
-        for p in self.players:
-            if p['id'] == session_id:
-                player = p
-                break
+        player = self.players.get(session_id)
         if not player:
             return
 
         if action_type == 'SHOOT':
-            self._place_bet(player, ps, int(payload.get('bet', 0)))
+            self._place_bet(player, int(payload.get('bet', 0)))
         elif action_type == 'SHOOT_SPECIAL':
-            self._place_bet(player, ps, int(payload.get('bet', 0)), payload.get('choice'))
+            self._place_bet(player, int(payload.get('bet', 0)), payload.get('choice'))
         elif action_type == 'PASS':
-            self._pass(player, ps)
+            self._pass(player)
 
         self._check_all_bets_placed()
 
     def deal_all(self):
         """Deal a gate to every player simultaneously."""
         # Ante: deduct from all players every deal
-        for p in self.players:
-            if p['balance'] >= self.ante:
-                p['balance'] -= self.ante
+        for p in self.players.values():
+            if p.balance >= self.ante:
+                p.balance -= self.ante
                 self.pot += self.ante
 
         # Deal cards to each player
-        for p in self.players:
-            sid = p['id']
+        self.undecided.clear()
+        shoe_before = len(self.deck.cards)
+        for p in self.players.values():
             c1 = self.deck.draw()
             c2 = self.deck.draw()
-            ps = self.player_states[sid]
-            ps['cards'] = {'left': c1, 'right': c2, 'result': None}
-            ps['result_msg'] = ''
-            ps['bet'] = 0
-            ps['choice'] = None
+            p.cards = {'left': c1, 'right': c2, 'result': None}
+            p.result_msg = ''
+            p.bet = 0
+            p.choice = None
+            p.odds = None
 
-            diff = abs(c1['val'] - c2['val'])
+            diff = abs(CARD_VALUE[c1] - CARD_VALUE[c2])
             if diff == 0:
-                ps['phase'] = 'SHOOTING_SPECIAL'
+                p.phase = 'SHOOTING_SPECIAL'
+                self.undecided.add(p.id)
             elif diff == 1:
                 # Auto-pass for consecutive
-                ps['phase'] = 'DONE'
-                ps['result_msg'] = 'Consecutive! Auto Pass.'
+                p.phase = 'DONE'
+                p.result_msg = 'Consecutive! Auto Pass.'
             else:
-                ps['phase'] = 'SHOOTING'
+                p.phase = 'SHOOTING'
+                self.undecided.add(p.id)
+
+        # Odds against what's left in the shoe once every gate is out. This
+        # knows every seat's cards, so seats get hints from _seat_odds instead
+        self.odds = GateOdds(self.deck.rank_left)
+        if self.show_odds:
+            self._seat_odds(shoe_before)
+
+        self._log('deal', ante=self.ante, pot=self.pot, balances=self._balances(),
+                  cards={p.id: [p.cards['left'], p.cards['right']] for p in self.players.values()})
 
         self.round_phase = 'IN_ROUND'
         self.message = "Cards dealt! You have 5 seconds!"
         self.last_update_id += 1
         self.decision_deadline = time.time() + 5
 
-        # Start decision timer
-        if self.decision_timer_task and not self.decision_timer_task.done():
-            self.decision_timer_task.cancel()
-        self.decision_timer_task = asyncio.get_event_loop().create_task(self._decision_timer())
+        self._start_decision_timer()
 
         # Check if all auto-passed (unlikely but possible)
         self._check_all_bets_placed()
 
-    async def _decision_timer(self):
-        """Wait 5 seconds then auto-pass all undecided players."""
-        try:
-            await asyncio.sleep(5)
-            if self.round_phase != 'IN_ROUND':
-                return
-            # Auto-pass everyone who hasn't acted
-            for p in self.players:
-                sid = p['id']
-                ps = self.player_states.get(sid)
-                if ps and ps['phase'] in ('SHOOTING', 'SHOOTING_SPECIAL'):
-                    ps['phase'] = 'DONE'
-                    ps['bet'] = 0
-                    ps['result_msg'] = '⏰ Time up! Auto Pass.'
-            self.last_update_id += 1
-            self._check_all_bets_placed()
-            await broadcast_personalized_state()
-        except asyncio.CancelledError:
-            pass
+    def _seat_odds(self, shoe_before):
+        """Give each deciding seat odds against the shoe as it can see it: the
+        other gates dealt this round are face down, so they count as unseen."""
+        dealt = [c for p in self.players.values() for c in (p.cards['left'], p.cards['right'])]
+        drawn = shoe_before - len(self.deck.cards)
+        if drawn != len(dealt):
+            drawn = len(FULL_DECK) - len(self.deck.cards)  # reshuffled mid-deal: only the new shoe's cards
+        first = len(dealt) - drawn  # dealt[first:] came out of the shoe now in play
+        unseen = list(self.deck.rank_left)
+        for c in dealt[first:]:
+            unseen[c % 13] += 1
+        for i, p in enumerate(self.players.values()):
+            if p.id not in self.undecided:
+                continue
+            counts = list(unseen)
+            for j in (2 * i, 2 * i + 1):
+                if j >= first:
+                    counts[dealt[j] % 13] -= 1  # the seat's own cards are known to it
+            odds = GateOdds(counts)
+            if p.phase == 'SHOOTING_SPECIAL':
+                p.odds = odds.pair(p.cards['left'])
+            else:
+                p.odds = odds.gate(p.cards['left'], p.cards['right'])
 
-    def _place_bet(self, player, ps, bet, choice=None):
+    def _start_decision_timer(self):
+        if self.decision_timer:
+            self.decision_timer.cancel()
+        self.decision_timer = scheduler.call_later(5, self._on_decision_deadline)
+
+    def _on_decision_deadline(self):
+        """Scheduler callback 5 seconds after the deal: auto-pass all undecided players."""
+        self.decision_timer = None
+        if self.round_phase != 'IN_ROUND':
+            return None
+        self._auto_pass_undecided()
+        return self
+
+    def _auto_pass_undecided(self):
+        """Auto-pass everyone who hasn't acted, which resolves the round."""
+        for sid in self.undecided:
+            p = self.players[sid]
+            p.phase = 'DONE'
+            p.bet = 0
+            p.result_msg = '⏰ Time up! Auto Pass.'
+        self._log('timeout', sids=list(self.undecided))
+        self.undecided.clear()
+        self.last_update_id += 1
+        self._check_all_bets_placed()
+
+    def _place_bet(self, player, bet, choice=None):
         """Player places a bet. Does NOT resolve yet — waits for all players."""
-        if ps['phase'] not in ('SHOOTING', 'SHOOTING_SPECIAL'):
+        if player.phase not in DECIDING_PHASES:
             return
         if bet <= 0:
             return
-        ps['bet'] = bet
-        ps['choice'] = choice  # None for normal, 'high'/'low' for special
-        ps['phase'] = 'BET_PLACED'
-        ps['result_msg'] = 'Bet placed. Waiting...'
+        player.bet = bet
+        player.choice = choice  # None for normal, 'high'/'low' for special
+        player.phase = 'BET_PLACED'
+        player.result_msg = 'Bet placed. Waiting...'
+        self.undecided.discard(player.id)
+        self._log('bet', sid=player.id, bet=bet, choice=choice)
         self.last_update_id += 1
 
-    def _pass(self, player, ps):
-        if ps['phase'] not in ('SHOOTING', 'SHOOTING_SPECIAL', 'FORCED_PASS'):
+    def _pass(self, player):
+        if player.phase not in DECIDING_PHASES:
             return
-        ps['phase'] = 'DONE'
-        ps['bet'] = 0
-        ps['result_msg'] = 'Passed.'
+        player.phase = 'DONE'
+        player.bet = 0
+        player.result_msg = 'Passed.'
+        self.undecided.discard(player.id)
+        self._log('pass', sid=player.id)
         self.last_update_id += 1
 
     def _check_all_bets_placed(self):
         """Check if all players have bet or passed. If so, resolve the round."""
         if self.round_phase != 'IN_ROUND':
             return
-        all_decided = all(
-            self.player_states[p['id']]['phase'] in ('BET_PLACED', 'DONE')
-            for p in self.players
-            if p['id'] in self.player_states
-        )
-        if all_decided:
+        if not self.undecided:
             # Cancel decision timer since everyone decided
-            if self.decision_timer_task and not self.decision_timer_task.done():
-                self.decision_timer_task.cancel()
-                self.decision_timer_task = None
+            if self.decision_timer:
+                self.decision_timer.cancel()
+                self.decision_timer = None
             self._resolve_round()
 
     def _resolve_round(self):
         """Resolve all bets simultaneously with proportional pot distribution."""
         # Step 1: Draw result cards and determine outcome for each bettor
-        results = []  # [{player, ps, outcome, raw_win, raw_loss}]
+        results = []  # [{player, outcome, bet, start}]
+        pot_before = self.pot
 
-        for p in self.players:
-            sid = p['id']
-            ps = self.player_states.get(sid)
-            if not ps or ps['phase'] != 'BET_PLACED':
+        for p in self.players.values():
+            if p.phase != 'BET_PLACED':
                 continue  # Already DONE (passed / auto-passed)
 
-            bet = ps['bet']
             res = self.deck.draw()
-            ps['cards']['result'] = res
+            p.cards['result'] = res
 
-            if ps['choice'] is not None:
+            if p.choice is not None:
                 # Special gate (pair)
-                outcome = self._judge_special(ps, res)
+                outcome = self._judge_special(p, res)
             else:
                 # Normal gate
-                outcome = self._judge_normal(ps, res)
+                outcome = self._judge_normal(p, res)
 
             results.append({
                 'player': p,
-                'ps': ps,
                 'outcome': outcome,  # 'win', 'hit_post', 'miss', 'loss', 'triple_post'
-                'bet': bet
+                'bet': p.bet,
+                'start': p.balance  # balance before settling, for the payout in hand history
             })
 
         # Step 2: Process losers first (add their losses to pot)
         for r in results:
             bet = r['bet']
             player = r['player']
-            ps = r['ps']
             if r['outcome'] == 'hit_post' or r['outcome'] == 'triple_post':
                 penalty = bet * 2
-                actual_loss = min(penalty, player['balance'])
-                player['balance'] -= actual_loss
+                actual_loss = min(penalty, player.balance)
+                player.balance -= actual_loss
                 self.pot += actual_loss
                 label = 'HIT POST' if r['outcome'] == 'hit_post' else 'TRIPLE POST'
-                ps['result_msg'] = f"{label}! -${actual_loss}"
-                ps['phase'] = 'DONE'
+                player.result_msg = f"{label}! -${actual_loss}"
+                player.phase = 'DONE'
             elif r['outcome'] in ('miss', 'loss'):
-                actual_loss = min(bet, player['balance'])
-                player['balance'] -= actual_loss
+                actual_loss = min(bet, player.balance)
+                player.balance -= actual_loss
                 self.pot += actual_loss
                 label = 'MISS' if r['outcome'] == 'miss' else 'LOSS'
-                ps['result_msg'] = f"{label}! -${actual_loss}"
-                ps['phase'] = 'DONE'
+                player.result_msg = f"{label}! -${actual_loss}"
+                player.phase = 'DONE'
 
         # Step 3: Distribute winnings to winners (proportionally if needed)
         winners = [r for r in results if r['outcome'] == 'win']
+        split = False
         if winners:
             total_wanted = sum(w['bet'] for w in winners)
             available = self.pot
+            split = total_wanted > available
 
-            if total_wanted <= available:
+            if not split:
                 # Enough in pot — pay full
                 for w in winners:
-                    w['player']['balance'] += w['bet']
+                    w['player'].balance += w['bet']
                     self.pot -= w['bet']
-                    w['ps']['result_msg'] = f"WIN! +${w['bet']}"
-                    w['ps']['phase'] = 'DONE'
+                    w['player'].result_msg = f"WIN! +${w['bet']}"
+                    w['player'].phase = 'DONE'
             else:
                 # Not enough — distribute proportionally by bet
                 for w in winners:
                     ratio = w['bet'] / total_wanted
                     payout = int(available * ratio)
-                    w['player']['balance'] += payout
+                    w['player'].balance += payout
                     self.pot -= payout
-                    w['ps']['result_msg'] = f"WIN! +${payout} (pot split)"
-                    w['ps']['phase'] = 'DONE'
+                    w['player'].result_msg = f"WIN! +${payout} (pot split)"
+                    w['player'].phase = 'DONE'
+
+        self._log('resolve', pot=self.pot, balances=self._balances(),
+                  results={r['player'].id: [r['player'].cards['result'], r['outcome'], r['bet']] for r in results})
+        if hand_store is not None:
+            for r in results:
+                r['payout'] = r['player'].balance - r['start']  # settlement only, no redistribution share
 
         # Step 4: Round complete — schedule auto-deal
         self.round_phase = 'COUNTDOWN'
@@ -350,32 +958,42 @@ class GameState:
         self.message = "Round complete! Next deal in 3s..."
         self.last_update_id += 1
         self._check_redistribute()
-        # Schedule the auto-deal coroutine
-        self.auto_deal_task = asyncio.get_event_loop().create_task(self._auto_deal_countdown())
-
-    async def _auto_deal_countdown(self):
-        """Countdown then auto-deal the next round."""
-        try:
-            for i in range(3, 0, -1):
-                self.countdown_seconds = i
-                self.message = f"Next deal in {i}s..."
-                self.last_update_id += 1
-                await broadcast_personalized_state()
-                await asyncio.sleep(1)
+        if hand_store is not None:
+            hand_store.record_round(self, results, pot_before, split)  # balances as they stand after redistribution
+        self._start_auto_deal()
+
+    def _start_auto_deal(self):
+        """Start the 3-2-1 countdown; the first tick fires on the next scheduler pass."""
+        self.auto_deal_timer = scheduler.call_later(0, self._on_countdown_tick)
+
+    def _on_countdown_tick(self):
+        """Scheduler callback once a second: announce the countdown, then auto-deal."""
+        if self.countdown_seconds > 0:
+            self.message = f"Next deal in {self.countdown_seconds}s..."
+            self.last_update_id += 1
+            self.countdown_seconds -= 1
+            # Step from this tick's slot so the countdown doesn't drift
+            self.auto_deal_timer = scheduler.call_at(self.auto_deal_timer.when + 1, self._on_countdown_tick)
+        else:
             # Deal!
+            self.auto_deal_timer = None
             self.deal_all()
-            await broadcast_personalized_state()
-        except asyncio.CancelledError:
-            # Cancelled (e.g. player disconnected)
-            self.round_phase = 'WAITING'
-            self.message = "Auto-deal cancelled. Click Start Game."
-            self.last_update_id += 1
+        return self
+
+    def _cancel_auto_deal(self):
+        """Stop the countdown (e.g. everyone disconnected) and wait for a manual deal."""
+        if self.auto_deal_timer:
+            self.auto_deal_timer.cancel()
+            self.auto_deal_timer = None
+        self.round_phase = 'WAITING'
+        self.message = "Auto-deal cancelled. Click Start Game."
+        self.last_update_id += 1
 
-    def _judge_normal(self, ps, res):
+    def _judge_normal(self, player, res):
         """Judge a normal gate shot. Returns 'win', 'hit_post', or 'miss'."""
-        c1 = ps['cards']['left']['val']
-        c2 = ps['cards']['right']['val']
-        r = res['val']
+        c1 = CARD_VALUE[player.cards['left']]
+        c2 = CARD_VALUE[player.cards['right']]
+        r = CARD_VALUE[res]
         ma, mi = max(c1, c2), min(c1, c2)
         if mi < r < ma:
             return 'win'
@@ -384,11 +1002,11 @@ class GameState:
         else:
             return 'miss'
 
-    def _judge_special(self, ps, res):
+    def _judge_special(self, player, res):
         """Judge a special gate shot (pair). Returns 'win', 'triple_post', or 'loss'."""
-        gate = ps['cards']['left']['val']
-        r = res['val']
-        choice = ps['choice']
+        gate = CARD_VALUE[player.cards['left']]
+        r = CARD_VALUE[res]
+        choice = player.choice
         if r == gate:
             return 'triple_post'
         if (choice == 'high' and r > gate) or (choice == 'low' and r < gate):
@@ -399,7 +1017,7 @@ class GameState:
         """If any player has balance <= 0, redistribute pot evenly to all players."""
         if not self.players:
             return
-        any_broke = any(p['balance'] <= 0 for p in self.players)
+        any_broke = any(p.balance <= 0 for p in self.players.values())
         if not any_broke:
             return
 
@@ -413,143 +1031,1755 @@ class GameState:
         share = total_pot // n
         remainder = total_pot - (share * n)
 
-        for p in self.players:
-            p['balance'] += share
+        for p in self.players.values():
+            p.balance += share
 
         self.pot = remainder  # leftover cents go to pot
+        self._log('redistribute', share=share, pot=self.pot, balances=self._balances())
         self.message = f"💰 A player went broke! Pot (${total_pot}) distributed evenly (+${share} each)."
         self.last_update_id += 1
 
+    def is_empty(self):
+        return not self.players and not self.clients and not self.reserved and not self.spectators
 
-game = GameState()
+    # --- Spectators ---
 
-# --- WebSocket Server ---
+    def add_spectator(self, ws, codec=JSON_CODEC):
+        self.spectators[ws] = codec
 
-connected_clients = {}  # websocket -> session_id
-client_last_activity = {}  # websocket -> timestamp
-client_last_update_id = {}  # websocket -> last sent update_id
-IDLE_TIMEOUT = 180  # 3 minutes in seconds
+    def remove_spectator(self, ws):
+        self.spectators.pop(ws, None)
+
+    def _notify_spectators(self):
+        if not self.spectators:
+            return
+        if self._spectator_task is None:
+            self._spectator_wake = asyncio.Event()
+            self._spectator_task = asyncio.get_event_loop().create_task(self._spectator_loop())
+        self._spectator_wake.set()
+
+    async def _spectator_loop(self):
+        """Send spectators the newest public state at most every SPECTATOR_INTERVAL."""
+        while True:
+            await self._spectator_wake.wait()
+            self._spectator_wake.clear()
+            if self._spectator_sent_id == self.last_update_id:
+                continue
+            self._spectator_sent_id = self.last_update_id
+            broadcast_spectator_state(self)
+            await asyncio.sleep(SPECTATOR_INTERVAL)
+
+    # --- Durability ---
+
+    def _log(self, kind, **fields):
+        if self.journal is not None:
+            self.journal.append(self.table_id, kind, fields)
+
+    def _balances(self):
+        return {p.id: p.balance for p in self.players.values()}
+
+    def durable_image(self):
+        """What survives a restart: pot, ante and every seat's balance."""
+        seats = {p.id: [p.name, p.balance, self.seat_keys.get(p.id)] for p in self.players.values()}
+        seats.update({p.id: [p.name, p.balance, self.seat_keys.get(p.id)] for p in self.reserved.values()})
+        return {'pot': self.pot, 'ante': self.ante, 'players': seats}
+
+    def restore(self, image):
+        """Load a recovered image. Any round in flight at the crash is void: bets
+        were never settled, antes already paid stay in the pot."""
+        self.pot = image['pot']
+        self.ante = image['ante']
+        for sid, (name, balance, *key) in image['players'].items():
+            # Keyed by session id, so seats that share a name ("Guest") stay separate
+            self.reserved[sid] = Player(sid, name, balance)
+            if key and key[0]:
+                self.seat_keys[sid] = key[0]
+        self.message = "Table restored. Reconnect to reclaim your seat."
+        self.last_update_id += 1
+        scheduler.call_later(RESERVED_SEAT_TTL, self._expire_reserved)
+
+    def _expire_reserved(self):
+        """Scheduler callback: seats nobody reclaimed after a restart are released."""
+        for player in self.reserved.values():
+            self.seat_keys.pop(player.id, None)
+            self._log('leave', sid=player.id)
+        self.reserved.clear()
+        tables.discard_if_empty(self.table_id)
+        return None
+
+    def mark_dirty(self):
+        """Queue a broadcast; the table's flusher coalesces bursts into one send."""
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        if self._flusher is None:
+            self._dirty = asyncio.Event()
+            self._flusher = loop.create_task(self._flush_loop())
+        if not self._dirty.is_set():
+            self._first_dirty = now
+            self._dirty.set()
+        self._last_dirty = now
+
+    async def _flush_loop(self):
+        """Broadcast once changes go quiet for BROADCAST_INTERVAL, or at BROADCAST_MAX_LATENCY."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._dirty.wait()
+            while True:
+                deadline = min(self._last_dirty + BROADCAST_INTERVAL, self._first_dirty + BROADCAST_MAX_LATENCY)
+                delay = deadline - loop.time()
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            self._dirty.clear()
+            broadcast_personalized_state(self)
+            self._notify_spectators()
+
+    def shutdown(self):
+        """Cancel pending timers and the flusher before the table is discarded."""
+        for timer in (self.auto_deal_timer, self.decision_timer, *self.held.values()):
+            if timer:
+                timer.cancel()
+        self.held.clear()
+        self.auto_deal_timer = None
+        self.decision_timer = None
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        if self._spectator_task is not None:
+            self._spectator_task.cancel()
+            self._spectator_task = None
+
+
+# --- Table Registry ---
+
+DEFAULT_TABLE_ID = 'main'
+MAX_TABLE_ID_LEN = 24
+
+
+def normalize_table_id(raw):
+    """Turn the table name sent with JOIN into a registry key."""
+    if not isinstance(raw, str):
+        return DEFAULT_TABLE_ID
+    table_id = raw.strip()[:MAX_TABLE_ID_LEN]
+    try:
+        table_id.encode('utf-8')
+    except UnicodeEncodeError:
+        return DEFAULT_TABLE_ID
+    return table_id or DEFAULT_TABLE_ID
 
-# Debounce mechanism
-_broadcast_pending = False
-_broadcast_lock = asyncio.Lock()
-
-async def broadcast_personalized_state():
-    """Send personalized state to all clients concurrently, with dedup."""
-    tasks = []
-    for ws, sid in list(connected_clients.items()):
-        if sid:
-            # Dedup: skip if client already has latest state
-            last_sent = client_last_update_id.get(ws, -1)
-            if last_sent == game.last_update_id:
+
+class TableRegistry:
+    """All tables hosted by this process, keyed by table id."""
+
+    def __init__(self):
+        self.tables = {}  # table_id -> GameState
+
+    def get(self, table_id):
+        return self.tables.get(table_id)
+
+    def get_or_create(self, table_id):
+        table = self.tables.get(table_id)
+        if table is None:
+            table = GameState(table_id)
+            table.journal = event_log
+            self.tables[table_id] = table
+            print(f"Table opened: {table_id} ({len(self.tables)} active)")
+        return table
+
+    def discard_if_empty(self, table_id):
+        table = self.tables.get(table_id)
+        if table is not None and table.is_empty():
+            table.shutdown()
+            del self.tables[table_id]
+            print(f"Table closed: {table_id} ({len(self.tables)} active)")
+
+    def snapshot(self):
+        return {table_id: t.durable_image() for table_id, t in self.tables.items()}
+
+    def restore(self, image):
+        for table_id, table_image in image.items():
+            if table_image['players']:
+                self.get_or_create(table_id).restore(table_image)
+
+
+tables = TableRegistry()
+
+# --- Durable Event Log ---
+# Every state transition is appended to a write-ahead log as one JSON line.
+# The action path only appends to an in-memory buffer; a single writer task
+# group-commits whatever accumulated while the previous fsync was running,
+# off the event loop. Periodic snapshots start a fresh log segment so replay
+# at startup only covers the tail.
+
+EVENT_LOG_DIR = os.environ.get("EVENT_LOG_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+SNAPSHOT_INTERVAL = float(os.environ.get("SNAPSHOT_INTERVAL", 30))  # seconds between snapshots
+SNAPSHOT_EVENTS = 50_000  # ...or this many events, whichever comes first
+RESERVED_SEAT_TTL = 600  # seconds a recovered seat waits to be reclaimed
+
+
+def apply_event(image, event):
+    """Fold one logged event into a registry image (see GameState.durable_image)."""
+    table = image.setdefault(event['t'], {'pot': 0, 'ante': 10, 'players': {}})
+    kind = event['e']
+    if kind == 'join':
+        table['players'][event['sid']] = [event['name'], event['balance'], event.get('key')]
+    elif kind == 'leave':
+        table['players'].pop(event['sid'], None)
+    if 'ante' in event:
+        table['ante'] = event['ante']
+    if 'pot' in event:
+        table['pot'] = event['pot']
+    for sid, balance in event.get('balances', {}).items():
+        if sid in table['players']:
+            table['players'][sid][1] = balance
+
+
+class EventLog:
+    def __init__(self, directory):
+        self.directory = directory
+        self.seq = 0  # last sequence number handed out
+        self._buffer = []  # encoded lines waiting for the writer
+        self._wake = asyncio.Event()
+        self._task = None
+        self._segment = None  # open file object of the current log segment
+        self._last_snapshot = 0
+        self._events_since_snapshot = 0
+        self._torn = False  # a failed write may have left a partial line at the segment's end
+        self.stats = {'events': 0, 'commits': 0, 'snapshots': 0, 'dropped': 0, 'errors': 0}
+
+    def append(self, table_id, kind, fields):
+        """Record one transition. Never blocks: durability follows within one commit."""
+        event = {'seq': self.seq + 1, 't': table_id, 'e': kind}
+        event.update(fields)
+        try:
+            line = self._encode(event)
+        except (TypeError, ValueError) as e:
+            # Refuse it here rather than let one bad event stop the writer
+            self.stats['dropped'] += 1
+            print(f"Event log: dropped unencodable {kind} event for table {table_id}: {e!r}")
+            return
+        self.seq += 1
+        self._buffer.append(line)
+        self._wake.set()
+
+    @staticmethod
+    def _encode(obj):
+        """One JSON line that is known to encode as UTF-8."""
+        line = JSON_CODEC.dumps(obj)
+        line.encode('utf-8')
+        return line
+
+    # --- Recovery ---
+
+    def recover(self):
+        """Rebuild the registry image from the latest snapshot plus the log tail."""
+        os.makedirs(self.directory, exist_ok=True)
+        image, snap_seq = {}, 0
+        snapshot_path = os.path.join(self.directory, 'snapshot.json')
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, 'rb') as f:
+                snapshot = JSON_CODEC.loads(f.read())
+            image, snap_seq = snapshot['tables'], snapshot['seq']
+        self.seq = snap_seq
+        replayed = skipped = 0
+        for name in self._segments():
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                for line in f:
+                    try:
+                        event = JSON_CODEC.loads(line)
+                    except ValueError:
+                        # A crash tears at most the last line; a failed write can leave
+                        # one mid-segment. Either way the events after it are still good.
+                        if line.endswith(b'\n'):
+                            skipped += 1
+                        continue
+                    if event['seq'] <= self.seq:
+                        continue  # covered by the snapshot, or written twice by a retried batch
+                    apply_event(image, event)
+                    self.seq = event['seq']
+                    replayed += 1
+        print(f"Event log: snapshot @{snap_seq}, replayed {replayed} events"
+              + (f", skipped {skipped} damaged lines" if skipped else ""))
+        return image
+
+    def _segments(self):
+        names = [n for n in os.listdir(self.directory) if n.startswith('wal-') and n.endswith('.log')]
+        return sorted(names)
+
+    # --- Writer ---
+
+    def start(self, snapshot_source):
+        """Begin group-committing; snapshot_source() returns the live registry image."""
+        self._snapshot_source = snapshot_source
+        self._segment = self._open_segment(self.seq + 1)
+        self._last_snapshot = asyncio.get_event_loop().time()
+        self._task = asyncio.get_event_loop().create_task(self._run())
+
+    def _open_segment(self, first_seq):
+        path = os.path.join(self.directory, f'wal-{first_seq:012d}.log')
+        return open(path, 'ab')
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            batch, self._buffer = self._buffer, []
+            snapshot = None
+            self._events_since_snapshot += len(batch)
+            if (self._events_since_snapshot >= SNAPSHOT_EVENTS
+                    or loop.time() - self._last_snapshot >= SNAPSHOT_INTERVAL):
+                # Taken on the loop thread right after the swap, so it covers
+                # exactly the events up to self.seq
+                snapshot = {'seq': self.seq, 'tables': self._snapshot_source()}
+                self._last_snapshot = loop.time()
+                self._events_since_snapshot = 0
+            try:
+                if batch:
+                    try:
+                        await loop.run_in_executor(None, self._commit, batch)
+                    except Exception:
+                        self._buffer[:0] = batch  # not durable yet: retried ahead of newer events
+                        raise
+                    self.stats['events'] += len(batch)
+                    self.stats['commits'] += 1
+                if snapshot is not None:
+                    await loop.run_in_executor(None, self._write_snapshot, snapshot)
+                    self.stats['snapshots'] += 1
+            except Exception as e:
+                # Keep the writer alive whatever went wrong, and retry after a pause
+                self.stats['errors'] += 1
+                print(f"Event log write failed: {e!r}")
+                await asyncio.sleep(1)
+                self._wake.set()
+
+    def _commit(self, batch):
+        data = ('\n'.join(batch) + '\n').encode('utf-8')
+        if self._torn:
+            data = b'\n' + data  # end the partial line so it is skipped on recovery
+        if self._segment.closed:
+            self._segment = open(self._segment.name, 'ab')  # reopening failed last time
+        segment = self._segment
+        start = segment.tell()
+        try:
+            segment.write(data)
+            segment.flush()
+            os.fsync(segment.fileno())
+        except Exception:
+            # Cut the segment back to the last good batch; reopen so no half
+            # written buffer is flushed later
+            self._torn = True
+            try:
+                segment.close()
+            except OSError:
+                pass
+            try:
+                os.truncate(segment.name, start)
+                self._torn = False
+            except OSError:
+                pass
+            self._segment = open(segment.name, 'ab')
+            raise
+        self._torn = False
+
+    def _write_snapshot(self, snapshot):
+        """Atomically replace the snapshot, then drop the segments it covers."""
+        path = os.path.join(self.directory, 'snapshot.json')
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(self._encode(snapshot).encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        old = self._segments()
+        self._segment.close()
+        self._segment = self._open_segment(snapshot['seq'] + 1)
+        current = os.path.basename(self._segment.name)
+        for name in old:
+            if name != current:
+                os.remove(os.path.join(self.directory, name))
+
+
+event_log = None  # EventLog once open_event_log() runs; None keeps tables in memory only
+
+
+def open_event_log(directory=EVENT_LOG_DIR):
+    """Recover tables from disk and start logging. No-op if the directory is empty."""
+    global event_log
+    if not directory:
+        return
+    event_log = EventLog(directory)
+    image = event_log.recover()
+    tables.restore(image)
+    for table in tables.tables.values():
+        table.journal = event_log
+    event_log.start(tables.snapshot)
+
+# --- Hand History Store ---
+# Every resolved hand goes to SQLite (WAL mode): the hands played, a
+# leaderboard row per player name and running per-table totals. The round
+# only appends plain tuples to a buffer; a writer task commits them in
+# batches on a worker thread. QUERY messages read through a small LRU cache
+# on a second thread, so neither writes nor queries run on the event loop.
+
+HISTORY_DB = os.environ.get("HISTORY_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "history.sqlite3"))
+HISTORY_BATCH_DELAY = 0.5  # seconds the writer waits to gather a batch
+HISTORY_CACHE_SIZE = 256
+HISTORY_CACHE_TTL = 2.0  # seconds; other worker processes write to the same file
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+SQLITE_MAX_INT = 2 ** 63 - 1  # cursors and offsets past this can't be bound as SQLite integers
+
+# Rows are keyed by seat (the session id clients see as a player's 'id'),
+# never by name: every "Guest" is a different player. The name is only shown.
+HISTORY_SCHEMA_VERSION = 2  # 1 keyed players by name; its tables are kept as *_v1
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hands (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    table_id TEXT NOT NULL,
+    seat TEXT NOT NULL,
+    player TEXT NOT NULL,
+    left_card INTEGER,
+    right_card INTEGER,
+    result_card INTEGER,
+    choice TEXT,
+    bet INTEGER NOT NULL,
+    outcome TEXT NOT NULL,
+    payout INTEGER NOT NULL,
+    balance INTEGER NOT NULL,
+    pot_before INTEGER NOT NULL,
+    pot_after INTEGER NOT NULL,
+    split INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS hands_by_seat ON hands (seat, id);
+CREATE INDEX IF NOT EXISTS hands_by_table ON hands (table_id, id);
+CREATE TABLE IF NOT EXISTS players (
+    seat TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    table_id TEXT NOT NULL,
+    balance INTEGER NOT NULL,
+    hands INTEGER NOT NULL,
+    won INTEGER NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS players_by_balance ON players (balance DESC);
+CREATE TABLE IF NOT EXISTS table_stats (
+    table_id TEXT PRIMARY KEY,
+    rounds INTEGER NOT NULL,
+    hands INTEGER NOT NULL,
+    wagered INTEGER NOT NULL,
+    paid_out INTEGER NOT NULL,
+    posts INTEGER NOT NULL,
+    splits INTEGER NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+HISTORY_QUERIES = {
+    # name -> (required parameter or None, keyset pagination on hands.id?)
+    'player_history': ('seat', True),
+    'table_history': ('table', True),
+    'leaderboard': (None, False),
+    'table_stats': ('table', False),
+}
+
+
+class HandStore:
+    def __init__(self, path):
+        self.path = path
+        self._buffer = []  # (hand rows, player rows, table row) per resolved round
+        self._wake = asyncio.Event()
+        self._writer = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix='history-write')
+        self._reader = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix='history-read')
+        self._local = threading.local()  # one sqlite3 connection per thread
+        self._cache = collections.OrderedDict()  # query key -> (expires, result)
+        self.stats = {'hands': 0, 'batches': 0, 'queries': 0, 'cache_hits': 0, 'errors': 0}
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=5)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._migrate(db)
+        return db
+
+    @staticmethod
+    def _migrate(db):
+        """Create the schema, moving tables of an older layout aside first."""
+        db.execute('BEGIN IMMEDIATE')  # one worker process at a time
+        try:
+            if db.execute('PRAGMA user_version').fetchone()[0] < HISTORY_SCHEMA_VERSION:
+                legacy = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+                if 'hands' in legacy:
+                    db.execute('DROP INDEX IF EXISTS hands_by_player')
+                    db.execute('DROP INDEX IF EXISTS hands_by_table')
+                    db.execute('DROP INDEX IF EXISTS players_by_balance')
+                    db.execute('ALTER TABLE hands RENAME TO hands_v1')
+                    db.execute('ALTER TABLE players RENAME TO players_v1')
+                for statement in HISTORY_SCHEMA.split(';'):
+                    if statement.strip():
+                        db.execute(statement)
+                db.execute(f'PRAGMA user_version = {HISTORY_SCHEMA_VERSION}')
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    def start(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._writer.submit(self._db).result()  # create the schema before serving
+        asyncio.get_event_loop().create_task(self._run())
+
+    # --- Writes ---
+
+    def record_round(self, table, results, pot_before, split):
+        """Called from _resolve_round: snapshot the round as rows, nothing else."""
+        now = time.time()
+        settled = {r['player'].id: r for r in results}
+        hands, players = [], []
+        wagered = paid_out = posts = 0
+        for p in table.players.values():
+            if p.cards['left'] is None:
+                continue  # joined mid-round, wasn't dealt in
+            r = settled.get(p.id)
+            if r is None:
+                outcome, bet, payout = 'pass', 0, 0
+            else:
+                outcome, bet, payout = r['outcome'], r['bet'], r['payout']
+            wagered += bet
+            paid_out += max(payout, 0)
+            posts += outcome in ('hit_post', 'triple_post')
+            hands.append((now, table.table_id, p.id, p.name, p.cards['left'], p.cards['right'], p.cards['result'],
+                          p.choice if r is not None else None, bet, outcome, payout, p.balance,
+                          pot_before, table.pot, int(split)))
+            players.append((p.id, p.name, table.table_id, p.balance, int(outcome == 'win'), now))
+        if hands:
+            self._buffer.append((hands, players, (table.table_id, len(hands), wagered, paid_out, posts, int(split), now)))
+            self._wake.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wake.wait()
+            await asyncio.sleep(HISTORY_BATCH_DELAY)
+            self._wake.clear()
+            batch, self._buffer = self._buffer, []
+            try:
+                written = await loop.run_in_executor(self._writer, self._commit, batch)
+            except Exception as e:
+                # Keep the writer alive whatever went wrong; later rounds still get stored
+                self.stats['errors'] += 1
+                print(f"Hand history write failed: {e!r}")
                 continue
-            client_last_update_id[ws] = game.last_update_id
-            state = game.get_state_for_player(sid)
-            tasks.append(_send_state(ws, state))
-    if tasks:
-        await asyncio.gather(*tasks)
+            self.stats['hands'] += written
+            self.stats['batches'] += 1
+            self._cache.clear()
 
-async def _send_state(ws, state):
+    def _commit(self, batch):
+        """Write a batch in one transaction. If that fails, write it again one round
+        per transaction so a bad round only loses itself. Returns hands written."""
+        try:
+            with self._db():
+                for hands, players, table_row in batch:
+                    self._insert(hands, players, table_row)
+            return sum(len(hands) for hands, _, _ in batch)
+        except Exception as e:
+            if len(batch) == 1:
+                raise
+            print(f"Hand history batch failed ({e!r}), retrying round by round")
+        written = 0
+        for hands, players, table_row in batch:
+            try:
+                with self._db():
+                    self._insert(hands, players, table_row)
+                written += len(hands)
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"Hand history: dropped a round on table {table_row[0]}: {e!r}")
+        return written
+
+    def _insert(self, hands, players, table_row):
+        db = self._db()
+        db.executemany(
+            'INSERT INTO hands (ts, table_id, seat, player, left_card, right_card, result_card, choice, bet,'
+            ' outcome, payout, balance, pot_before, pot_after, split)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', hands)
+        db.executemany(
+            'INSERT INTO players (seat, name, table_id, balance, hands, won, updated) VALUES (?, ?, ?, ?, 1, ?, ?)'
+            ' ON CONFLICT (seat) DO UPDATE SET name = excluded.name, table_id = excluded.table_id,'
+            ' balance = excluded.balance, hands = hands + 1, won = won + excluded.won,'
+            ' updated = excluded.updated', players)
+        db.execute(
+            'INSERT INTO table_stats (table_id, rounds, hands, wagered, paid_out, posts, splits, updated)'
+            ' VALUES (?, 1, ?, ?, ?, ?, ?, ?)'
+            ' ON CONFLICT (table_id) DO UPDATE SET rounds = rounds + 1, hands = hands + excluded.hands,'
+            ' wagered = wagered + excluded.wagered, paid_out = paid_out + excluded.paid_out,'
+            ' posts = posts + excluded.posts, splits = splits + excluded.splits, updated = excluded.updated',
+            table_row)
+
+    # --- Queries ---
+
+    async def query(self, name, arg, cursor, offset, limit):
+        """Run one of HISTORY_QUERIES; results are cached for HISTORY_CACHE_TTL."""
+        key = (name, arg, cursor, offset, limit)
+        now = time.monotonic()
+        cached = self._cache.get(key)
+        self.stats['queries'] += 1
+        if cached is not None and cached[0] > now:
+            self._cache.move_to_end(key)
+            self.stats['cache_hits'] += 1
+            return cached[1]
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self._reader, self._select, name, arg, cursor, offset, limit)
+        self._cache[key] = (now + HISTORY_CACHE_TTL, result)
+        self._cache.move_to_end(key)
+        while len(self._cache) > HISTORY_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return result
+
+    def _select(self, name, arg, cursor, offset, limit):
+        db = self._db()
+        if name in ('player_history', 'table_history'):
+            column = 'seat' if name == 'player_history' else 'table_id'
+            rows = db.execute(
+                f'SELECT id, ts, table_id, seat, player, left_card, right_card, result_card, choice, bet, outcome,'
+                f' payout, balance, pot_before, pot_after, split FROM hands'
+                f' WHERE {column} = ? AND id < ? ORDER BY id DESC LIMIT ?',
+                (arg, cursor if cursor is not None else SQLITE_MAX_INT, limit + 1)).fetchall()
+            keys = ('id', 'ts', 'table', 'seat', 'player', 'left', 'right', 'result', 'choice', 'bet', 'outcome',
+                    'payout', 'balance', 'pot_before', 'pot_after', 'split')
+        elif name == 'leaderboard':
+            rows = db.execute('SELECT seat, name, table_id, balance, hands, won, updated FROM players'
+                              ' ORDER BY balance DESC LIMIT ? OFFSET ?', (limit + 1, offset)).fetchall()
+            keys = ('seat', 'name', 'table', 'balance', 'hands', 'won', 'updated')
+        else:  # table_stats
+            rows = db.execute('SELECT table_id, rounds, hands, wagered, paid_out, posts, splits, updated'
+                              ' FROM table_stats WHERE table_id = ?', (arg,)).fetchall()
+            keys = ('table', 'rounds', 'hands', 'wagered', 'paid_out', 'posts', 'splits', 'updated')
+        more = len(rows) > limit
+        rows = [dict(zip(keys, row)) for row in rows[:limit]]
+        result = {'rows': rows, 'more': more}
+        if more and name in ('player_history', 'table_history'):
+            result['next_cursor'] = rows[-1]['id']
+        elif more:
+            result['next_offset'] = offset + limit
+        return result
+
+
+hand_store = None  # HandStore once open_hand_store() runs
+
+
+def open_hand_store(path=HISTORY_DB):
+    """Start recording hands to SQLite. No-op if HISTORY_DB is empty."""
+    global hand_store
+    if not path:
+        return
+    hand_store = HandStore(path)
+    hand_store.start()
+    print(f"Hand history: {path}")
+
+
+def _query_int(value):
+    """A non-negative int that SQLite can bind."""
+    return isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= SQLITE_MAX_INT
+
+
+async def handle_query(websocket, data):
+    """QUERY {query, seat | table, cursor | offset, limit, seq}: one page of hand history.
+    A seat is the player 'id' from STATE."""
+    name = data.get('query')
+    spec = HISTORY_QUERIES.get(name) if isinstance(name, str) else None
+    reply = {'type': 'QUERY_RESULT', 'query': name}
+    if 'seq' in data:
+        reply['seq'] = data['seq']
+    if hand_store is None or spec is None:
+        reply['error'] = 'history disabled' if hand_store is None else 'unknown query'
+        await websocket.send(json.dumps(reply))
+        return
+    param, keyset = spec
+    arg = data.get(param) if param else None
+    cursor, offset, limit = data.get('cursor'), data.get('offset', 0), data.get('limit', HISTORY_PAGE_SIZE)
+    if ((param and not isinstance(arg, str)) or not _query_int(offset) or not _query_int(limit)
+            or not (cursor is None or _query_int(cursor))):
+        reply['error'] = 'bad parameters'
+        await websocket.send(json.dumps(reply))
+        return
+    if param == 'table':
+        arg = normalize_table_id(arg)
+    limit = min(max(limit, 1), HISTORY_MAX_PAGE_SIZE)
     try:
-        await ws.send(json.dumps({'type': 'STATE', 'state': state}))
+        reply.update(await hand_store.query(name, arg, cursor if keyset else None, 0 if keyset else offset, limit))
+    except Exception as e:
+        hand_store.stats['errors'] += 1
+        print(f"History query {name} failed: {e!r}")
+        reply['error'] = 'query failed'
+    await websocket.send(json.dumps(reply))
+
+
+# --- WebSocket Server ---
+
+connected_clients = {}  # websocket -> GameState the socket has joined
+spectating = {}  # websocket -> GameState the socket is watching
+client_last_activity = {}  # websocket -> loop time of the last admitted message
+IDLE_TIMEOUT = 180  # 3 minutes in seconds
+idle_timers = {}  # websocket -> scheduler Timer for its idle deadline
+
+# Keepalive: websockets pings every PING_INTERVAL and closes a connection
+# whose pong is PING_TIMEOUT late, so dead TCP connections are found without
+# app traffic. Pongs are not activity: a live but silent tab is still kicked.
+PING_INTERVAL = float(os.environ.get("PING_INTERVAL", 20))
+PING_TIMEOUT = float(os.environ.get("PING_TIMEOUT", 20))
+
+# Broadcast coalescing: a table flushes once changes have been quiet for
+# BROADCAST_INTERVAL, and never later than BROADCAST_MAX_LATENCY after the
+# first unsent change.
+BROADCAST_INTERVAL = int(os.environ.get("BROADCAST_INTERVAL_MS", 50)) / 1000
+BROADCAST_MAX_LATENCY = int(os.environ.get("BROADCAST_MAX_LATENCY_MS", 100)) / 1000
+
+# Slow consumers: a socket whose send has been stuck this long while newer
+# state is waiting gets disconnected instead of holding memory forever.
+SLOW_CLIENT_TIMEOUT = float(os.environ.get("SLOW_CLIENT_TIMEOUT", 10))
+
+# Session resumption: WELCOME carries a secret token. When a socket drops,
+# its seat is held for RESUME_GRACE seconds, and a JOIN with that token in
+# the window takes the seat back with a single full STATE instead of a
+# leave/join pair broadcast to the whole table.
+RESUME_GRACE = float(os.environ.get("RESUME_GRACE", 30))
+sessions = {}  # resume token -> (table_id, session_id)
+session_tokens = {}  # session_id -> resume token
+
+
+def start_session(table_id, session_id):
+    token = secrets.token_urlsafe(16)
+    sessions[token] = (table_id, session_id)
+    session_tokens[session_id] = token
+    return token
+
+
+def end_session(session_id):
+    sessions.pop(session_tokens.pop(session_id, None), None)
+
+
+def seat_key(token):
+    """What the event log keeps of a resume token: enough to match it, not to use it."""
+    return hashlib.sha256(token.encode('utf-8', 'replace')).hexdigest()[:32]
+
+
+# Spectators: a shared public-only STATE, pushed to all of a table's
+# watchers at once and at most SPECTATOR_RATE times a second. A watcher
+# whose socket is still backed up just misses a frame; the next one is a
+# full STATE anyway.
+SPECTATOR_INTERVAL = 1 / float(os.environ.get("SPECTATOR_RATE", 4))
+SPECTATOR_MAX_BUFFER = 256 * 1024  # bytes queued on a spectator socket before frames are skipped
+
+send_stats = {
+    'sent': 0,  # STATE/PATCH messages written
+    'deduped': 0,  # broadcasts skipped, client already had this update_id
+    'superseded': 0,  # updates folded into a newer one before they went out
+    'send_errors': 0,
+    'slow_disconnects': 0,
+    'spectator_sent': 0,  # spectator frames written
+    'spectator_skipped': 0  # spectator frames skipped, socket still backed up
+}
+
+
+class ClientOutbox:
+    """Latest-only outbound queue for one socket.
+
+    A broadcast just flags the outbox. Its writer task builds the message
+    when the socket is ready, diffed against the update the client actually
+    received, so a slow socket skips straight to the newest state and never
+    holds up the rest of the table.
+    """
+    __slots__ = ('ws', 'table', 'session_id', 'codec', 'busy_since', '_wake', '_task')
+
+    def __init__(self, ws, table, session_id, codec=JSON_CODEC):
+        self.ws = ws
+        self.table = table
+        self.session_id = session_id
+        self.codec = codec
+        self.busy_since = 0  # loop time the in-flight send started, 0 when idle
+        self._wake = asyncio.Event()
+        self._task = asyncio.get_event_loop().create_task(self._run())
+
+    def notify(self):
+        """Ask for the table's latest state to be sent."""
+        if self.table.client_last_update_id.get(self.ws, -1) == self.table.last_update_id:
+            send_stats['deduped'] += 1
+            return
+        if self._wake.is_set():
+            send_stats['superseded'] += 1
+        self._wake.set()
+        if self.busy_since and asyncio.get_event_loop().time() - self.busy_since > SLOW_CLIENT_TIMEOUT:
+            self._disconnect_slow()
+
+    def _disconnect_slow(self):
+        send_stats['slow_disconnects'] += 1
+        print(f"Dropping slow client {self.session_id} on table {self.table.table_id} "
+              f"(send stuck > {SLOW_CLIENT_TIMEOUT:g}s)")
+        self.close()
+        self._abort()
+
+    def _abort(self):
+        transport = getattr(self.ws, 'transport', None)
+        if transport is not None:
+            transport.abort()  # ws_handler's finally does the rest
+
+    async def _run(self):
+        try:
+            await self._send_loop()
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except Exception as e:
+            send_stats['send_errors'] += 1
+            print(f"Send to {self.session_id} failed: {e!r}")
+        # Only close() (the socket left the table) cancels this task. Any other
+        # exit would leave a seated socket that never gets another update.
+        self._abort()
+
+    async def _send_loop(self):
+        ws = self.ws
+        table = self.table
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            last_sent = table.client_last_update_id.get(ws, -1)
+            if last_sent == table.last_update_id:
+                continue
+            table.client_last_update_id[ws] = table.last_update_id
+            message = table.get_update_message(ws, self.session_id, last_sent, self.codec)
+            self.busy_since = loop.time()
+            try:
+                await ws.send(message)
+                send_stats['sent'] += 1
+            finally:
+                self.busy_since = 0
+
+    def close(self):
+        if not self._task.done():
+            self._task.cancel()
+
+
+# Admission control: every inbound frame passes a size cap (before it is
+# parsed) and a per-socket token bucket; ACTIONs are also checked against
+# the current phase. Anything rejected is counted in admission_stats and
+# never reaches the game or the broadcast path.
+MAX_MESSAGE_BYTES = 2048  # UTF-8 bytes on the wire; larger frames are counted and skipped
+MAX_FRAME_BYTES = MAX_MESSAGE_BYTES * 8  # websockets max_size: larger frames close the socket (1009) unread
+MESSAGE_RATE = float(os.environ.get("MESSAGE_RATE", 20))  # sustained messages/s per socket
+MESSAGE_BURST = 40
+RATE_LIMIT_KICK = 200  # rate-limited messages in a row before the socket is closed
+
+admission_stats = {
+    'oversized': 0,
+    'malformed': 0,
+    'rate_limited': 0,
+    'rejected_actions': 0,  # invalid for the current phase, or bad payload
+    'rate_limit_disconnects': 0
+}
+
+
+class TokenBucket:
+    """MESSAGE_BURST tokens, refilled at MESSAGE_RATE per second."""
+    __slots__ = ('tokens', 'updated', 'limited')
+
+    def __init__(self, now):
+        self.tokens = MESSAGE_BURST
+        self.updated = now
+        self.limited = 0  # consecutive messages refused
+
+    def take(self, now):
+        self.tokens = min(MESSAGE_BURST, self.tokens + (now - self.updated) * MESSAGE_RATE)
+        self.updated = now
+        if self.tokens < 1:
+            self.limited += 1
+            return False
+        self.tokens -= 1
+        self.limited = 0
+        return True
+
+
+MAX_NAME_LENGTH = 32  # the join form allows 10
+
+
+def wire_size(message):
+    """Bytes a frame took on the wire. websockets has already decoded text frames."""
+    return len(message.encode('utf-8')) if isinstance(message, str) else len(message)
+
+
+def parse_codec(data):
+    """The codec a JOIN or WATCH asks for (JSON if absent or unknown), or None if 'codec' isn't a str."""
+    name = data.get('codec')
+    if name is None:
+        return JSON_CODEC
+    if not isinstance(name, str):
+        return None
+    return NEGOTIABLE_CODECS.get(name, JSON_CODEC)
+
+
+def parse_join(data):
+    """(name, ante, table_id, codec, resume token) from a JOIN, or None if any
+    field is unusable. Checked before the JOIN touches any table."""
+    name = data.get('name', 'Guest')
+    ante = data.get('ante', 10)
+    table_id = data.get('table')
+    resume = data.get('resume')
+    codec = parse_codec(data)
+    if not isinstance(name, str) or not 0 < len(name) <= MAX_NAME_LENGTH:
+        return None
+    try:
+        name.encode('utf-8')  # lone surrogates can't go out on the wire or into the logs
+    except UnicodeEncodeError:
+        return None
+    if not isinstance(ante, int) or isinstance(ante, bool):
+        return None
+    if codec is None or not all(v is None or isinstance(v, str) for v in (table_id, resume)):
+        return None
+    return name, max(1, ante), normalize_table_id(table_id), codec, resume
+
+
+def broadcast_personalized_state(table):
+    """Queue the latest personalized state for every client at one table."""
+    if metrics is not None:
+        started = time.perf_counter()
+    for outbox in list(table.clients.values()):
+        outbox.notify()
+    if metrics is not None:
+        metrics.broadcasts += 1
+        metrics.broadcast_seconds.observe(time.perf_counter() - started)
+
+def broadcast_spectator_state(table):
+    """Push the shared public STATE to every spectator at one table."""
+    by_codec = {}
+    for ws, codec in table.spectators.items():
+        transport = getattr(ws, 'transport', None)
+        if transport is not None and transport.get_write_buffer_size() > SPECTATOR_MAX_BUFFER:
+            send_stats['spectator_skipped'] += 1
+            continue
+        by_codec.setdefault(codec, []).append(ws)
+    for codec, sockets in by_codec.items():
+        websockets.broadcast(sockets, table.get_spectator_message(codec))
+        send_stats['spectator_sent'] += len(sockets)
+
+def _arm_idle_timer(websocket, since):
+    """One scheduler deadline per socket, at its last activity + IDLE_TIMEOUT.
+
+    Messages only update client_last_activity; the timer is not moved on every
+    message. When it fires it either kicks the socket or re-arms for the newer
+    deadline, so the work done is O(expired sockets), not a scan of them all.
+    """
+    idle_timers[websocket] = scheduler.call_at(since + IDLE_TIMEOUT, lambda: _on_idle_deadline(websocket))
+
+def _on_idle_deadline(websocket):
+    """Scheduler callback: kick the socket if it really has been quiet."""
+    last = client_last_activity.get(websocket)
+    if last is None:
+        return None  # already closed
+    now = asyncio.get_event_loop().time()
+    if websocket in spectating:
+        _arm_idle_timer(websocket, now)  # watching is not idling
+        return None
+    if last + IDLE_TIMEOUT > now:
+        _arm_idle_timer(websocket, last)  # active since the timer was set
+        return None
+    idle_timers.pop(websocket, None)
+    asyncio.ensure_future(_kick_idle(websocket))
+    return None
+
+async def _kick_idle(ws):
+    table = connected_clients.get(ws)
+    outbox = table.clients.get(ws) if table else None
+    sid = outbox.session_id if outbox else None
+    player = table.players.get(sid) if sid else None
+    print(f"Kicking idle player: {player.name if player else 'Unknown'} ({sid})")
+    if table is not None:
+        await _leave_table(ws, table, sid)  # no grace period for idle seats
+    try:
+        await ws.send(json.dumps({'type': 'ERROR', 'msg': 'You have been disconnected due to inactivity (3 min).'}))
+        await ws.close()
     except Exception:
         pass
 
-async def schedule_broadcast():
-    """Debounced broadcast — batches rapid state changes within 50ms."""
-    global _broadcast_pending
-    if _broadcast_pending:
+def _detach_socket(websocket, table):
+    """Stop sending table updates to a socket; False if it was already detached."""
+    connected_clients.pop(websocket, None)
+    outbox = table.clients.pop(websocket, None)
+    table.forget_client(websocket)
+    if outbox is None:
+        return False
+    outbox.close()
+    return True
+
+async def _leave_table(websocket, table, session_id, hold=False):
+    """Detach a socket from its table and give up (or hold) its seat. The table
+    is dropped once nobody is left."""
+    _detach_socket(websocket, table)
+    # The seat is handled even if this socket never got an outbox (it failed
+    # mid-JOIN), unless it is already gone (kicked) or resumed on another socket
+    if session_id not in table.players or any(
+            outbox.session_id == session_id for outbox in table.clients.values()):
+        tables.discard_if_empty(table.table_id)
         return
-    _broadcast_pending = True
-    await asyncio.sleep(0.05)  # 50ms debounce
-    _broadcast_pending = False
-    await broadcast_personalized_state()
-
-async def idle_checker():
-    """Periodically check for idle clients and disconnect them."""
-    while True:
-        await asyncio.sleep(30)  # Check every 30 seconds
-        now = time.time()
-        idle_clients = []
-        for ws, last in list(client_last_activity.items()):
-            if now - last > IDLE_TIMEOUT:
-                idle_clients.append(ws)
-        for ws in idle_clients:
-            sid = connected_clients.get(ws)
-            player_name = 'Unknown'
-            if sid:
-                for p in game.players:
-                    if p['id'] == sid:
-                        player_name = p['name']
-                        break
-            print(f"Kicking idle player: {player_name} ({sid})")
-            try:
-                await ws.send(json.dumps({'type': 'ERROR', 'msg': 'You have been disconnected due to inactivity (3 min).'}))
-                await ws.close()
-            except Exception:
-                pass
+    if hold and session_id in table.players:
+        table.hold_seat(session_id)
+        return
+    end_session(session_id)
+    table.remove_player(session_id)
+    table.mark_dirty()
+    tables.discard_if_empty(table.table_id)
+
+def _stop_watching(websocket):
+    watched = spectating.pop(websocket, None)
+    if watched is not None:
+        watched.remove_spectator(websocket)
+        tables.discard_if_empty(watched.table_id)
+
+async def _redirect_if_foreign(websocket, table_id):
+    """Send the client to the worker process that owns table_id; True if redirected."""
+    owner = table_owner(table_id)
+    if owner == worker_index:
+        return False
+    await websocket.send(json.dumps({'type': 'REDIRECT', 'table': table_id, 'port': worker_port(owner)}))
+    return True
+
+def _reclaim(token, table):
+    """After a restart, find the recovered seat an old resume token belongs to and
+    bind the token to it again; returns that seat's session id or None."""
+    if not isinstance(token, str) or not table.reserved:
+        return None
+    session_id = table.find_reserved(seat_key(token))
+    if session_id is not None:
+        sessions[token] = (table.table_id, session_id)
+        session_tokens[session_id] = token
+    return session_id
+
+def _resume(websocket, token, table_id):
+    """Find the held seat a resume token points at; returns (table, session_id) or None."""
+    if not isinstance(token, str):
+        return None
+    entry = sessions.get(token)
+    if entry is None or entry[0] != table_id:
+        return None
+    table = tables.get(table_id)
+    session_id = entry[1]
+    if table is None or session_id not in table.players:
+        return None
+    for ws, outbox in list(table.clients.items()):
+        if outbox.session_id == session_id:
+            # The old socket hasn't noticed it's dead yet; the new one takes over
+            _detach_socket(ws, table)
+            transport = getattr(ws, 'transport', None)
+            if transport is not None:
+                transport.abort()
+    table.resume_seat(session_id)
+    return table, session_id
 
 async def ws_handler(websocket):
-    session_id = str(id(websocket))
+    session_id = secrets.token_hex(6)
     print(f"New connection: {session_id}")
-    client_last_activity[websocket] = time.time()
+    loop = asyncio.get_running_loop()
+    client_last_activity[websocket] = loop.time()
+    _arm_idle_timer(websocket, loop.time())
+    table = None  # GameState this socket has joined
+    bucket = TokenBucket(loop.time())
 
     try:
         async for message in websocket:
-            # Update activity timestamp on every message
-            client_last_activity[websocket] = time.time()
+            # A character is at most 4 bytes, so only long text frames need encoding to measure
+            if len(message) > MAX_MESSAGE_BYTES // 4 and wire_size(message) > MAX_MESSAGE_BYTES:
+                admission_stats['oversized'] += 1
+                continue
+            if not bucket.take(loop.time()):
+                admission_stats['rate_limited'] += 1
+                if bucket.limited >= RATE_LIMIT_KICK:
+                    admission_stats['rate_limit_disconnects'] += 1
+                    print(f"Closing {session_id}: message rate limit")
+                    await websocket.close(1008, 'rate limit exceeded')
+                    break
+                continue
+            try:
+                data = decode_inbound(message)
+            except (ValueError, TypeError, IndexError, KeyError, struct.error, RecursionError):
+                data = None
+            if not isinstance(data, dict):
+                admission_stats['malformed'] += 1
+                continue
 
-            data = json.loads(message)
+            # Update activity timestamp on every admitted message
+            client_last_activity[websocket] = loop.time()
             req_type = data.get('type')
+            seen_update_id = table.last_update_id if table is not None else None
 
             if req_type == 'JOIN':
-                name = data.get('name', 'Guest')
-                ante = data.get('ante', 10)
-                player = game.add_player(session_id, name)
-                game.ante = max(1, int(ante))  # Update ante (last joiner's setting wins)
-                connected_clients[websocket] = session_id
-                await websocket.send(json.dumps({'type': 'WELCOME', 'your_id': player['id']}))
+                joined = parse_join(data)
+                if joined is None:
+                    admission_stats['malformed'] += 1
+                    continue
+                name, ante, table_id, codec, resume = joined
+                if table is not None and table.table_id != table_id:
+                    # Switching tables: give up the old seat first
+                    await _leave_table(websocket, table, session_id)
+                    table = None
+                _stop_watching(websocket)
+                if await _redirect_if_foreign(websocket, table_id):
+                    continue
+                resumed = table is None and _resume(websocket, resume, table_id)
+                if resumed:
+                    table, session_id = resumed
+                    player = table.players[session_id]
+                    table.forget_client(websocket)  # one full STATE brings the client back in sync
+                    print(f"Resumed session {session_id} on table {table_id}")
+                else:
+                    reclaim = table is None
+                    table = tables.get_or_create(table_id)
+                    session_id = (reclaim and _reclaim(resume, table)) or session_id
+                    token = session_tokens.get(session_id) or start_session(table_id, session_id)
+                    player = table.add_player(session_id, name, seat_key(token))
+                    if ante != table.ante:
+                        table.ante = ante  # Update ante (last joiner's setting wins)
+                        table.last_update_id += 1
+                token = session_tokens.get(session_id) or start_session(table_id, session_id)
+                outbox = table.clients.get(websocket)
+                if outbox is None:
+                    table.clients[websocket] = ClientOutbox(websocket, table, session_id, codec)
+                elif outbox.codec is not codec:
+                    outbox.codec = codec
+                    table.forget_client(websocket)  # next update is a full STATE in the new format
+                connected_clients[websocket] = table
+                await websocket.send(json.dumps({'type': 'WELCOME', 'your_id': player.id, 'table': table_id,
+                                                 'codec': codec.name, 'token': token, 'resumed': bool(resumed)}))
+
+            elif req_type == 'WATCH':
+                # Spectate without a seat: shared public STATE only, no ante, no actions
+                codec = parse_codec(data)
+                if codec is None or not isinstance(data.get('table', ''), (str, type(None))):
+                    admission_stats['malformed'] += 1
+                    continue
+                table_id = normalize_table_id(data.get('table'))
+                if table is not None:
+                    await _leave_table(websocket, table, session_id)
+                    table = None
+                _stop_watching(websocket)
+                if await _redirect_if_foreign(websocket, table_id):
+                    continue
+                watched = tables.get_or_create(table_id)
+                watched.add_spectator(websocket, codec)
+                spectating[websocket] = watched
+                await websocket.send(json.dumps({'type': 'WELCOME', 'your_id': None, 'table': table_id,
+                                                 'codec': codec.name, 'role': 'spectator'}))
+                await websocket.send(watched.get_spectator_message(codec))
 
             elif req_type == 'ACTION':
-                game.handle_action(session_id, data.get('action'), data.get('payload', {}))
-
-            # Broadcast personalized state to each client (debounced)
-            await schedule_broadcast()
+                action = data.get('action')
+                payload = data.get('payload', {})
+                reason = 'not seated' if table is None else table.admit_action(session_id, action, payload)
+                if reason is not None:
+                    admission_stats['rejected_actions'] += 1
+                    if 'seq' in data:
+                        await websocket.send(json.dumps({'type': 'NACK', 'seq': data['seq'], 'reason': reason}))
+                    continue
+                if metrics is None:
+                    table.handle_action(session_id, action, payload)
+                else:
+                    started = time.perf_counter()
+                    table.handle_action(session_id, action, payload)
+                    metrics.observe_action(action, time.perf_counter() - started)
+                if 'seq' in data:
+                    # Ack right away; the resulting state follows on the next flush
+                    await websocket.send(json.dumps({'type': 'ACK', 'seq': data['seq']}))
+
+            elif req_type == 'QUERY':
+                await handle_query(websocket, data)
+
+            elif req_type == 'ADMIN':
+                await handle_admin(websocket, data)
+
+            elif req_type == 'RESYNC':
+                # Client missed a PATCH base; its next update is a full STATE
+                if table is not None:
+                    table.forget_client(websocket)
+
+            # Queue a broadcast (coalesced by the table's flusher) only if the
+            # table changed; otherwise just catch this socket up if it is behind
+            if table is not None:
+                if table.last_update_id != seen_update_id:
+                    table.mark_dirty()
+                elif table.client_last_update_id.get(websocket) != table.last_update_id:
+                    outbox = table.clients.get(websocket)
+                    if outbox is not None:
+                        outbox.notify()
 
     except websockets.exceptions.ConnectionClosed:
         pass
     finally:
-        if websocket in connected_clients:
-            del connected_clients[websocket]
-        if websocket in client_last_activity:
-            del client_last_activity[websocket]
-        if websocket in client_last_update_id:
-            del client_last_update_id[websocket]
-        game.remove_player(session_id)
-        await broadcast_personalized_state()
+        client_last_activity.pop(websocket, None)
+        timer = idle_timers.pop(websocket, None)
+        if timer is not None:
+            timer.cancel()
+        if table is not None:
+            await _leave_table(websocket, table, session_id, hold=True)
+        _stop_watching(websocket)
 
 async def start_ws():
-    async with websockets.serve(ws_handler, "0.0.0.0", 8765):
-        print("WebSocket Server started on port 8765")
-        # Start idle checker in the background
-        asyncio.create_task(idle_checker())
-        print(f"Idle timeout checker started ({IDLE_TIMEOUT}s)")
+    options = {'max_size': MAX_FRAME_BYTES, 'ping_interval': PING_INTERVAL, 'ping_timeout': PING_TIMEOUT}
+    if WORKERS == 1:
+        async with websockets.serve(ws_handler, "0.0.0.0", WS_PORT, **options):
+            print(f"WebSocket Server started on port {WS_PORT} "
+                  f"(idle kick {IDLE_TIMEOUT}s, ping every {PING_INTERVAL:g}s)")
+            await asyncio.Future()
+
+    # Worker mode: every worker accepts on the shared port (the kernel spreads
+    # new connections), and on its own port for clients redirected to it
+    port = worker_port(worker_index)
+    async with websockets.serve(ws_handler, "0.0.0.0", WS_PORT, reuse_port=True, **options), \
+            websockets.serve(ws_handler, "0.0.0.0", port, **options):
+        print(f"Worker {worker_index}: WebSocket Server started on ports {WS_PORT} and {port}")
+        asyncio.create_task(report_worker_stats())
         await asyncio.Future()
 
 # --- HTTP Server (Static Files) ---
-def start_http():
-    os.chdir(os.path.dirname(os.path.abspath(__file__)))
-    handler = http.server.SimpleHTTPRequestHandler
+# Served from the same event loop as the websocket server. Every asset is
+# held in memory with gzip (and brotli, if installed) bodies compressed once,
+# revalidated with ETag/Last-Modified, over keep-alive connections.
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_ROUTES = {'/': 'index.html', '/index.html': 'index.html', '/app.js': 'app.js', '/style.css': 'style.css'}
+CONTENT_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.js': 'application/javascript; charset=utf-8',
+    '.css': 'text/css; charset=utf-8'
+}
+HTTP_KEEPALIVE_TIMEOUT = 15  # seconds an idle keep-alive connection stays open
+HTTP_MAX_HEADER = 16 * 1024
+STATIC_RECHECK = 1.0  # seconds between mtime checks, so edits show up without a restart
+
+
+class StaticAsset:
+    """One static file in memory, with compressed variants and cache validators."""
+
+    def __init__(self, filename):
+        self.path = os.path.join(STATIC_ROOT, filename)
+        self.content_type = CONTENT_TYPES.get(os.path.splitext(filename)[1], 'application/octet-stream')
+        self.mtime = None
+        self.checked = 0
+        self.refresh()
+
+    def refresh(self):
+        now = time.monotonic()
+        if self.mtime is not None and now - self.checked < STATIC_RECHECK:
+            return
+        self.checked = now
+        mtime = os.stat(self.path).st_mtime
+        if mtime == self.mtime:
+            return
+        with open(self.path, 'rb') as f:
+            body = f.read()
+        self.mtime = mtime
+        self.bodies = {
+            'identity': body,
+            'gzip': gzip.compress(body, compresslevel=9, mtime=0)
+        }
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(body)
+        self.etag = '"%s"' % hashlib.sha1(body).hexdigest()[:20]
+        self.last_modified = email.utils.formatdate(mtime, usegmt=True)
+
+    def body_for(self, accept_encoding):
+        """Pick the smallest body the client accepts: (encoding, bytes)."""
+        accepted = set()
+        for token in accept_encoding.split(','):
+            name, _, params = token.strip().partition(';')
+            if params.replace(' ', '') not in ('q=0', 'q=0.0'):
+                accepted.add(name.strip().lower())
+        for encoding in ('br', 'gzip'):
+            if encoding in self.bodies and (encoding in accepted or '*' in accepted):
+                return encoding, self.bodies[encoding]
+        return 'identity', self.bodies['identity']
+
+    def not_modified(self, headers):
+        if 'if-none-match' in headers:
+            return self.etag in (tag.strip() for tag in headers['if-none-match'].split(',')) \
+                or headers['if-none-match'].strip() == '*'
+        if 'if-modified-since' in headers:
+            since = email.utils.parsedate_to_datetime(headers['if-modified-since']) \
+                if headers['if-modified-since'] else None
+            return since is not None and int(self.mtime) <= since.timestamp()
+        return False
+
+
+static_assets = {}  # filename -> StaticAsset, loaded on first request
+
+
+def _static_response(method, target, headers):
+    """Build (status, extra headers, body) for one request."""
+    if method not in ('GET', 'HEAD'):
+        return '405 Method Not Allowed', [('Allow', 'GET, HEAD')], b'Method Not Allowed'
+    filename = STATIC_ROUTES.get(target.split('?', 1)[0])
+    if filename is None:
+        return '404 Not Found', [], b'Not Found'
+    asset = static_assets.get(filename)
+    if asset is None:
+        asset = static_assets[filename] = StaticAsset(filename)
+    else:
+        asset.refresh()
+
+    validators = [
+        ('ETag', asset.etag),
+        ('Last-Modified', asset.last_modified),
+        ('Cache-Control', 'no-cache'),  # always revalidate; a 304 costs a few bytes
+        ('Vary', 'Accept-Encoding')
+    ]
+    try:
+        if asset.not_modified(headers):
+            return '304 Not Modified', validators, b''
+    except (TypeError, ValueError):
+        pass  # unparseable If-Modified-Since: serve the full body
+    encoding, body = asset.body_for(headers.get('accept-encoding', ''))
+    extra = [('Content-Type', asset.content_type)] + validators
+    if encoding != 'identity':
+        extra.append(('Content-Encoding', encoding))
+    return '200 OK', extra, body
+
+
+async def handle_http(reader, writer):
+    """Minimal HTTP/1.1 static file handler with keep-alive."""
+    try:
+        while True:
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), HTTP_KEEPALIVE_TIMEOUT)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+                break
+            lines = head.decode('latin-1').split('\r\n')
+            try:
+                method, target, version = lines[0].split(' ', 2)
+            except ValueError:
+                writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                break
+            headers = {}
+            for line in lines[1:]:
+                name, sep, value = line.partition(':')
+                if sep:
+                    headers[name.strip().lower()] = value.strip()
+
+            connection = headers.get('connection', '').lower()
+            if version == 'HTTP/1.1':
+                keep_alive = 'close' not in connection
+            else:
+                keep_alive = 'keep-alive' in connection
+            if 'content-length' in headers or 'transfer-encoding' in headers:
+                keep_alive = False  # we never read request bodies
+
+            status, extra, body = _static_response(method, target, headers)
+            response = [f'HTTP/1.1 {status}', f'Content-Length: {len(body)}']
+            response += [f'{name}: {value}' for name, value in extra]
+            response.append('Connection: keep-alive' if keep_alive else 'Connection: close')
+            if keep_alive:
+                response.append(f'Keep-Alive: timeout={HTTP_KEEPALIVE_TIMEOUT}')
+            writer.write(('\r\n'.join(response) + '\r\n\r\n').encode('latin-1'))
+            if method != 'HEAD' and status != '304 Not Modified':
+                writer.write(body)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_http():
     port = int(os.environ.get("PORT", 8000))
-    with socketserver.TCPServer(("", port), handler) as httpd:
-        print(f"HTTP Server started on port {port}")
-        httpd.serve_forever()
+    server = await asyncio.start_server(handle_http, "0.0.0.0", port, limit=HTTP_MAX_HEADER,
+                                        reuse_port=WORKERS > 1)
+    print(f"HTTP Server started on port {port}")
+    return server
+
+
+# --- Metrics ---
+# Prometheus text exposition on a local port, enabled by METRICS_PORT.
+# While disabled, `metrics` is None and every hot-path hook is a single
+# global check. Send outcomes are read from send_stats, which is always kept.
+
+METRICS_PORT = os.environ.get("METRICS_PORT", "")  # e.g. 9100; workers use METRICS_PORT + index
+ACTION_TYPES = ('DEAL', 'SHOOT', 'SHOOT_SPECIAL', 'PASS')
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1)
+LOOP_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+BYTES_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 65536)
+LOOP_LAG_INTERVAL = 0.25  # seconds between event-loop lag probes
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is one bisect and three adds."""
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels=''):
+        lines = []
+        cumulative = 0
+        sep = ',' if labels else ''
+        for bound, n in zip((*self.bounds, '+Inf'), self.counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {self.sum}')
+        lines.append(f'{name}_count{suffix} {self.count}')
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self.actions = {action: 0 for action in ACTION_TYPES + ('other',)}
+        self.broadcasts = 0
+        self.action_seconds = Histogram(LATENCY_BUCKETS)
+        self.broadcast_seconds = Histogram(LATENCY_BUCKETS)
+        self.state_bytes = Histogram(BYTES_BUCKETS)
+        self.patch_bytes = Histogram(BYTES_BUCKETS)
+        self.loop_lag_seconds = Histogram(LOOP_LAG_BUCKETS)
+
+    def observe_action(self, action, seconds):
+        self.actions[action if action in self.actions else 'other'] += 1
+        self.action_seconds.observe(seconds)
+
+    def render(self):
+        """Prometheus text format, version 0.0.4."""
+        out = []
+
+        def family(name, kind, help_text, samples):
+            out.append(f'# HELP {name} {help_text}')
+            out.append(f'# TYPE {name} {kind}')
+            out.extend(samples)
+
+        family('gate_actions_total', 'counter', 'Player actions handled, by type.',
+               [f'gate_actions_total{{action="{a}"}} {n}' for a, n in self.actions.items()])
+        family('gate_broadcasts_total', 'counter', 'Table broadcasts fanned out to client outboxes.',
+               [f'gate_broadcasts_total {self.broadcasts}'])
+        family('gate_sends_total', 'counter', 'Outbound STATE/PATCH sends, by outcome.',
+               [f'gate_sends_total{{result="sent"}} {send_stats["sent"]}',
+                f'gate_sends_total{{result="deduped"}} {send_stats["deduped"]}',
+                f'gate_sends_total{{result="superseded"}} {send_stats["superseded"]}',
+                f'gate_sends_total{{result="error"}} {send_stats["send_errors"]}'])
+        family('gate_spectator_frames_total', 'counter', 'Shared spectator STATE frames, by outcome.',
+               [f'gate_spectator_frames_total{{result="sent"}} {send_stats["spectator_sent"]}',
+                f'gate_spectator_frames_total{{result="skipped"}} {send_stats["spectator_skipped"]}'])
+        family('gate_slow_client_disconnects_total', 'counter', 'Sockets dropped for not keeping up.',
+               [f'gate_slow_client_disconnects_total {send_stats["slow_disconnects"]}'])
+        family('gate_inbound_rejected_total', 'counter', 'Inbound messages refused by admission control.',
+               [f'gate_inbound_rejected_total{{reason="{reason}"}} {admission_stats[reason]}'
+                for reason in ('oversized', 'malformed', 'rate_limited', 'rejected_actions')])
+        family('gate_rate_limit_disconnects_total', 'counter', 'Sockets closed for exceeding the message rate.',
+               [f'gate_rate_limit_disconnects_total {admission_stats["rate_limit_disconnects"]}'])
+        if hand_store is not None:
+            family('gate_history_hands_total', 'counter', 'Hands committed to the hand history store.',
+                   [f'gate_history_hands_total {hand_store.stats["hands"]}'])
+            family('gate_history_queries_total', 'counter', 'History QUERY messages, by cache result.',
+                   [f'gate_history_queries_total{{cache="hit"}} {hand_store.stats["cache_hits"]}',
+                    f'gate_history_queries_total{{cache="miss"}} '
+                    f'{hand_store.stats["queries"] - hand_store.stats["cache_hits"]}'])
+        family('gate_tables', 'gauge', 'Open tables.', [f'gate_tables {len(tables.tables)}'])
+        family('gate_players', 'gauge', 'Seated players, including held seats.',
+               [f'gate_players {sum(len(t.players) for t in tables.tables.values())}'])
+        family('gate_sockets', 'gauge', 'Open websocket connections.', [f'gate_sockets {len(client_last_activity)}'])
+        family('gate_spectators', 'gauge', 'Sockets watching a table.', [f'gate_spectators {len(spectating)}'])
+        family('gate_handle_action_seconds', 'histogram', 'Time spent in GameState.handle_action.',
+               self.action_seconds.render('gate_handle_action_seconds'))
+        family('gate_broadcast_seconds', 'histogram', 'Time spent in broadcast_personalized_state.',
+               self.broadcast_seconds.render('gate_broadcast_seconds'))
+        family('gate_message_bytes', 'histogram', 'Serialized size of each outbound message.',
+               self.state_bytes.render('gate_message_bytes', 'type="STATE"')
+               + self.patch_bytes.render('gate_message_bytes', 'type="PATCH"'))
+        family('gate_event_loop_lag_seconds', 'histogram', 'How late a periodic probe wakes up.',
+               self.loop_lag_seconds.render('gate_event_loop_lag_seconds'))
+        return '\n'.join(out) + '\n'
+
+
+metrics = None  # Metrics once start_metrics() runs
+
+
+async def probe_loop_lag():
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        metrics.loop_lag_seconds.observe(max(0.0, loop.time() - expected))
 
-if __name__ == "__main__":
-    t = threading.Thread(target=start_http, daemon=True)
-    t.start()
 
+async def handle_metrics(reader, writer):
+    """Answer one scrape and close; anything but GET /metrics is a 404."""
     try:
-        asyncio.run(start_ws())
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), HTTP_KEEPALIVE_TIMEOUT)
+        target = head.split(b' ', 2)[1] if head.count(b' ') >= 2 else b''
+        if target == b'/metrics':
+            status, body = '200 OK', metrics.render().encode('utf-8')
+        else:
+            status, body = '404 Not Found', b'Not Found'
+        writer.write((f'HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                      f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics():
+    """Serve /metrics on localhost if METRICS_PORT is set."""
+    global metrics
+    if not METRICS_PORT:
+        return
+    metrics = Metrics()
+    port = int(METRICS_PORT) + worker_index
+    await asyncio.start_server(handle_metrics, "127.0.0.1", port, limit=HTTP_MAX_HEADER)
+    asyncio.create_task(probe_loop_lag())
+    print(f"Metrics on http://127.0.0.1:{port}/metrics")
+
+
+# --- Tracing & Profiling ---
+# TRACE_FILE turns on span tracing of the round lifecycle: the methods in
+# TRACED_SPANS and every broadcast fan-out are wrapped at startup (nothing
+# is wrapped otherwise) and each call appends one tab-separated line:
+#   start_us  duration_ns  span  update_id  depth  table
+# trace_summary.py turns the file into per-span percentiles and the slowest
+# calls. With ADMIN_TOKEN set, an ADMIN message can also run a cProfile or
+# tracemalloc capture over a time window.
+
+TRACE_FILE = os.environ.get("TRACE_FILE", "")  # workers append .<index>
+TRACED_SPANS = {
+    'deal_all': 'deal',
+    '_on_decision_deadline': 'decision_timer',
+    '_check_all_bets_placed': 'check_bets',
+    '_resolve_round': 'resolve',
+    '_on_countdown_tick': 'countdown',
+}
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")  # empty: ADMIN messages are refused
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_MAX_SECONDS = 60
+
+
+class Tracer:
+    def __init__(self, path):
+        self.file = open(path, 'a', buffering=1 << 16)
+        self.origin = time.perf_counter_ns()
+        self.depth = 0  # nesting, e.g. resolve inside check_bets
+        self.labels = {}  # table_id -> escaped form safe for one line
+        self.file.write(f"# trace pid={os.getpid()} start={time.time():.6f}\n")
+
+    def wrap(self, span, fn):
+        """Trace fn, whose first argument is the GameState it works on."""
+        clock = time.perf_counter_ns
+
+        @functools.wraps(fn)
+        def traced(table, *args, **kwargs):
+            started = clock()
+            self.depth += 1
+            try:
+                return fn(table, *args, **kwargs)
+            finally:
+                self.depth -= 1
+                ended = clock()
+                label = self.labels.get(table.table_id)
+                if label is None:
+                    label = self.labels[table.table_id] = json.dumps(table.table_id)[1:-1]
+                self.file.write(f"{(started - self.origin) // 1000}\t{ended - started}\t{span}\t"
+                                f"{table.last_update_id}\t{self.depth}\t{label}\n")
+        return traced
+
+    async def flush_periodically(self):
+        while True:
+            await asyncio.sleep(1)
+            self.file.flush()
+
+
+tracer = None  # Tracer once start_tracing() runs
+profiling = False  # an ADMIN capture is running
+
+
+def start_tracing():
+    """Wrap the lifecycle methods and broadcast fan-out if TRACE_FILE is set."""
+    global tracer, broadcast_personalized_state
+    if not TRACE_FILE:
+        return
+    path = TRACE_FILE if WORKERS == 1 else f"{TRACE_FILE}.{worker_index}"
+    tracer = Tracer(path)
+    for method, span in TRACED_SPANS.items():
+        setattr(GameState, method, tracer.wrap(span, getattr(GameState, method)))
+    broadcast_personalized_state = tracer.wrap('broadcast', broadcast_personalized_state)
+    asyncio.create_task(tracer.flush_periodically())
+    print(f"Tracing round lifecycle to {path}")
+
+
+async def capture_cpu(seconds, path):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+    profiler.dump_stats(path)
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(15)
+    return report.getvalue().strip().splitlines()
+
+
+async def capture_memory(seconds, path):
+    tracemalloc.start()
+    try:
+        await asyncio.sleep(seconds)
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    snapshot.dump(path)
+    return [str(stat) for stat in snapshot.statistics('lineno')[:15]]
+
+
+async def handle_admin(websocket, data):
+    """ADMIN {token, cmd: 'profile' | 'tracemalloc', seconds}: capture, save, reply with the top entries."""
+    global profiling
+    token = data.get('token')
+    if not ADMIN_TOKEN or not isinstance(token, str) or not hmac.compare_digest(
+            token.encode('utf-8', 'replace'), ADMIN_TOKEN.encode('utf-8')):
+        await websocket.send(json.dumps({'type': 'ERROR', 'msg': 'Not authorized.'}))
+        return
+    cmd = data.get('cmd')
+    capture = {'profile': (capture_cpu, 'pstats'), 'tracemalloc': (capture_memory, 'tracemalloc')}.get(cmd)
+    if capture is None or profiling:
+        msg = f"Unknown admin command: {cmd}" if capture is None else "A capture is already running."
+        await websocket.send(json.dumps({'type': 'ERROR', 'msg': msg}))
+        return
+    seconds = data.get('seconds', 10)
+    if isinstance(seconds, bool) or not (isinstance(seconds, int)
+                                         or (isinstance(seconds, float) and math.isfinite(seconds))):
+        await websocket.send(json.dumps({'type': 'ERROR', 'msg': "'seconds' must be a number."}))
+        return
+    seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{cmd}-{worker_index}-{int(time.time())}.{capture[1]}")
+    print(f"Admin: {cmd} capture for {seconds:g}s -> {path}")
+    profiling = True
+    try:
+        top = await capture[0](seconds, path)
+    finally:
+        profiling = False
+    await websocket.send(json.dumps({'type': 'ADMIN_RESULT', 'cmd': cmd, 'file': path, 'top': top}))
+
+
+# --- Multi-process Mode ---
+# WORKERS=N runs N worker processes, each a complete server with its own
+# event loop, owning the tables whose id hashes to it. All workers accept on
+# the shared ports with SO_REUSEPORT; a JOIN that lands on the wrong worker
+# is answered with a REDIRECT to the owner's private port (WS_PORT + 1 + i),
+# so table state never crosses a process boundary. Workers report load to
+# the supervisor over a multiprocessing queue; a worker that dies is
+# restarted and recovers its tables from its own event log.
+# Keep WORKERS fixed while a data directory is in use: ownership follows it.
+
+WORKERS = max(1, int(os.environ.get("WORKERS", 1)))
+WS_PORT = int(os.environ.get("WS_PORT", 8765))
+WORKER_STATS_INTERVAL = 10  # seconds between load reports to the supervisor
+
+worker_index = 0  # shard this process serves
+worker_stats = None  # multiprocessing queue to the supervisor, in worker mode
+
+
+def table_owner(table_id):
+    """Worker index that owns a table; stable across processes and restarts."""
+    return zlib.crc32(table_id.encode('utf-8')) % WORKERS
+
+
+def worker_port(index):
+    return WS_PORT + 1 + index
+
+
+async def report_worker_stats():
+    while True:
+        await asyncio.sleep(WORKER_STATS_INTERVAL)
+        if not multiprocessing.parent_process().is_alive():
+            print(f"Worker {worker_index}: supervisor is gone, exiting")
+            os._exit(1)
+        players = sum(len(t.players) for t in tables.tables.values())
+        worker_stats.put((worker_index, {'tables': len(tables.tables), 'players': players,
+                                         'sockets': len(client_last_activity), 'sent': send_stats['sent']}))
+
+
+def run_worker(index, stats):
+    global worker_index, worker_stats
+    worker_index = index
+    worker_stats = stats
+    directory = EVENT_LOG_DIR and os.path.join(EVENT_LOG_DIR, f"worker-{index}")
+    try:
+        asyncio.run(main(directory))
+    except KeyboardInterrupt:
+        pass
+
+
+def supervise():
+    """Start the workers, keep them running and print their combined load."""
+    stats = multiprocessing.Queue()
+    procs = {}
+    load = {}
+
+    def spawn(index):
+        proc = multiprocessing.Process(target=run_worker, args=(index, stats), name=f"worker-{index}")
+        proc.start()
+        procs[index] = proc
+
+    for index in range(WORKERS):
+        spawn(index)
+    print(f"Supervisor: {WORKERS} workers")
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        while True:
+            try:
+                index, report = stats.get(timeout=WORKER_STATS_INTERVAL)
+                load[index] = report
+            except queue.Empty:
+                pass
+            for index, proc in procs.items():
+                if not proc.is_alive():
+                    print(f"Worker {index} exited ({proc.exitcode}), restarting")
+                    spawn(index)
+            if len(load) == WORKERS:
+                totals = {key: sum(r[key] for r in load.values()) for key in load[0]}
+                print("Load: " + ", ".join(f"{v} {k}" for k, v in totals.items()))
+                load.clear()
     except KeyboardInterrupt:
         print("Stopping...")
+    finally:
+        for proc in procs.values():
+            proc.terminate()
+            proc.join()
+
+
+async def main(event_log_dir=EVENT_LOG_DIR):
+    open_event_log(event_log_dir)
+    open_hand_store()
+    await start_metrics()
+    start_tracing()
+    await start_http()
+    await start_ws()
+
+if __name__ == "__main__":
+    if WORKERS > 1:
+        supervise()
+    else:
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            print("Stopping...")
@@ -0,0 +1,284 @@
+"""Headless Monte Carlo simulator for Shoot the Gate economics.
+
+Runs the real table rules from server.py (dealing, judging, proportional
+pot split, broke-player redistribution) with the asyncio timers switched
+off, so millions of rounds can be played offline to tune the ante.
+
+    python simulate.py --rounds 1000000 --players 6 --ante 5,10,20 --strategy spread
+
+Bots are plain functions registered in STRATEGIES; pass one name for every
+seat or a comma list that is assigned round-robin. Work is split across a
+process pool, and each worker refills its shoe from blocks of shuffles
+drawn with NumPy when it is installed.
+"""
+import argparse
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from server import CARD_VALUE, FULL_DECK, Deck, GameState
+
+try:
+    import numpy as np
+except ImportError:  # plain random.shuffle still works, just slower
+    np = None
+
+
+# --- Headless Table ---
+
+class BatchDeck(Deck):
+    """Deck that refills from a block of shuffles generated at once with NumPy."""
+
+    def __init__(self, rng, batch=512):
+        self._rng = rng
+        self._batch = batch
+        self._shoes = []
+        super().__init__()
+
+    def shuffle(self):
+        if not self._shoes:
+            block = np.tile(np.arange(len(FULL_DECK), dtype=np.int8), (self._batch, 1))
+            self._shoes = self._rng.permuted(block, axis=1).tolist()
+        self.cards = self._shoes.pop()
+
+
+class HeadlessTable(GameState):
+    """GameState with no timers: the simulator drives every round by hand."""
+
+    def __init__(self, deck=None):
+        super().__init__('sim')
+        if deck is not None:
+            self.deck = deck
+        self.broke_rounds = 0  # rounds that ended with someone at $0
+        self.redistributions = 0
+        self.stalled_rounds = 0  # someone broke but the pot was empty
+
+    def _start_decision_timer(self):
+        pass
+
+    def _start_auto_deal(self):
+        pass
+
+    def _check_redistribute(self):
+        if any(p.balance <= 0 for p in self.players.values()):
+            self.broke_rounds += 1
+            if self.pot > 0:
+                self.redistributions += 1
+            else:
+                self.stalled_rounds += 1
+        super()._check_redistribute()
+
+
+# --- Bot Strategies ---
+# A strategy gets (player, table, rng) while the player is SHOOTING or
+# SHOOTING_SPECIAL and returns (action, payload), or None to let the
+# 5-second timer auto-pass them.
+
+def _max_bet(player, table):
+    """Same cap the UI slider uses: min(pot, balance)."""
+    return min(table.pot if table.pot > 0 else 1, player.balance)
+
+
+def always_pass(player, table, rng):
+    return ('PASS', {})
+
+
+def idle(player, table, rng):
+    return None
+
+
+def min_bet(player, table, rng):
+    """Bet $1 on every gate, pick high/low at random on pairs."""
+    if player.phase == 'SHOOTING_SPECIAL':
+        return ('SHOOT_SPECIAL', {'bet': 1, 'choice': rng.choice(('high', 'low'))})
+    return ('SHOOT', {'bet': 1})
+
+
+def spread(player, table, rng):
+    """Bet a pot fraction that grows with the gate width; pass narrow gates."""
+    left = CARD_VALUE[player.cards['left']]
+    right = CARD_VALUE[player.cards['right']]
+    cap = _max_bet(player, table)
+    if player.phase == 'SHOOTING_SPECIAL':
+        # Pairs near the middle are coin flips, near the edges they're safe
+        if left == 7:
+            return ('PASS', {})
+        choice = 'high' if left < 7 else 'low'
+        return ('SHOOT_SPECIAL', {'bet': max(1, cap // 4), 'choice': choice})
+    width = abs(left - right) - 1
+    if width < 6:
+        return ('PASS', {})
+    return ('SHOOT', {'bet': max(1, cap * width // 22)})
+
+
+def expected_value(player, table, rng):
+    """Bet only when the exact odds for the current shoe favour it."""
+    cap = _max_bet(player, table)
+    if player.phase == 'SHOOTING_SPECIAL':
+        odds = table.odds.pair(player.cards['left'])
+        choice = 'high' if odds['ev_high'] >= odds['ev_low'] else 'low'
+        edge = odds['ev_' + choice]
+        if edge <= 0:
+            return ('PASS', {})
+        return ('SHOOT_SPECIAL', {'bet': max(1, int(cap * edge)), 'choice': choice})
+    edge = table.odds.gate(player.cards['left'], player.cards['right'])['ev']
+    if edge <= 0:
+        return ('PASS', {})
+    return ('SHOOT', {'bet': max(1, int(cap * edge))})
+
+
+def all_in(player, table, rng):
+    """Always bet the maximum the slider allows."""
+    cap = _max_bet(player, table)
+    if player.phase == 'SHOOTING_SPECIAL':
+        return ('SHOOT_SPECIAL', {'bet': cap, 'choice': rng.choice(('high', 'low'))})
+    return ('SHOOT', {'bet': cap})
+
+
+STRATEGIES = {
+    'pass': always_pass,
+    'idle': idle,
+    'min': min_bet,
+    'spread': spread,
+    'ev': expected_value,
+    'all_in': all_in,
+}
+
+
+# --- Simulation ---
+
+def play_round(table, bots, rng):
+    """Deal, let each bot act, auto-pass the rest, resolve. No event loop."""
+    table.deal_all()
+    for sid in list(table.undecided):
+        player = table.players[sid]
+        decision = bots[sid](player, table, rng)
+        if decision is not None:
+            table.handle_action(sid, decision[0], decision[1])
+    if table.round_phase == 'IN_ROUND':
+        table._auto_pass_undecided()
+
+
+def run_chunk(job):
+    """Play `rounds` rounds in sessions of `session_rounds`; runs in a worker."""
+    seed, rounds, players, ante, strategies, session_rounds, balance = job
+    rng = random.Random(seed)
+    random.seed(seed)
+    np_rng = np.random.default_rng(seed) if np is not None else None
+
+    pot_sizes = Counter()
+    session_drifts = []
+    totals = Counter()
+
+    played = 0
+    while played < rounds:
+        deck = BatchDeck(np_rng) if np_rng is not None else Deck()
+        table = HeadlessTable(deck)
+        table.ante = ante
+        bots = {}
+        for i in range(players):
+            sid = f'bot{i}'
+            table.add_player(sid, sid).balance = balance
+            bots[sid] = STRATEGIES[strategies[i % len(strategies)]]
+
+        n = min(session_rounds, rounds - played)
+        for _ in range(n):
+            play_round(table, bots, rng)
+            pot_sizes[table.pot] += 1
+        played += n
+
+        # House drift: chips that ended up parked in the pot per round
+        session_drifts.append(table.pot / n)
+        totals['rounds'] += n
+        totals['broke_rounds'] += table.broke_rounds
+        totals['redistributions'] += table.redistributions
+        totals['stalled_rounds'] += table.stalled_rounds
+
+    return pot_sizes, session_drifts, totals
+
+
+def percentile(counter, q):
+    """q-th percentile of a value -> count histogram."""
+    total = sum(counter.values())
+    target = q / 100 * (total - 1)
+    seen = 0
+    for value in sorted(counter):
+        seen += counter[value]
+        if seen > target:
+            return value
+    return 0
+
+
+def simulate(rounds, players, ante, strategies, workers, session_rounds=500, balance=1000, seed=None):
+    """Run the Monte Carlo job for one ante and merge worker results."""
+    seed = random.randrange(2 ** 32) if seed is None else seed
+    chunks = max(1, workers * 4)
+    per_chunk = -(-rounds // chunks)
+    jobs = []
+    for i in range(chunks):
+        n = min(per_chunk, rounds - i * per_chunk)
+        if n > 0:
+            jobs.append((seed + i, n, players, ante, strategies, session_rounds, balance))
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run_chunk, jobs))
+    else:
+        results = [run_chunk(job) for job in jobs]
+
+    pot_sizes = Counter()
+    session_drifts = []
+    totals = Counter()
+    for pots, drifts, counts in results:
+        pot_sizes.update(pots)
+        session_drifts.extend(drifts)
+        totals.update(counts)
+    return pot_sizes, session_drifts, totals
+
+
+def print_report(ante, pot_sizes, session_drifts, totals, elapsed):
+    rounds = totals['rounds']
+    drifts = Counter(round(d, 2) for d in session_drifts)
+    print(f"\n=== ante ${ante}: {rounds:,} rounds in {elapsed:.1f}s ({rounds / elapsed:,.0f} rounds/s) ===")
+    print("pot size      p50 ${}  p90 ${}  p99 ${}  max ${}".format(
+        percentile(pot_sizes, 50), percentile(pot_sizes, 90), percentile(pot_sizes, 99), max(pot_sizes)))
+    print(f"bankruptcy    {totals['broke_rounds'] / rounds:.4%} of rounds"
+          f"  (redistributed {totals['redistributions']:,}, stalled on empty pot {totals['stalled_rounds']:,})")
+    print("house drift   ${:.3f}/round mean   p10 ${}  p50 ${}  p90 ${}  (pot growth per session round)".format(
+        sum(session_drifts) / len(session_drifts),
+        percentile(drifts, 10), percentile(drifts, 50), percentile(drifts, 90)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=100_000)
+    parser.add_argument('--players', type=int, default=6)
+    parser.add_argument('--ante', default='10', help="one ante or a comma list to sweep, e.g. 5,10,20")
+    parser.add_argument('--strategy', default='spread',
+                        help=f"comma list assigned to seats round-robin; one of {', '.join(STRATEGIES)}")
+    parser.add_argument('--session-rounds', type=int, default=500,
+                        help="rounds before the table is reset to fresh balances")
+    parser.add_argument('--balance', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    strategies = args.strategy.split(',')
+    unknown = [s for s in strategies if s not in STRATEGIES]
+    if unknown:
+        parser.error(f"unknown strategy: {', '.join(unknown)}")
+
+    print(f"{args.players} players ({', '.join(strategies)}), {args.workers} workers, "
+          f"shuffles via {'NumPy' if np is not None else 'random'}")
+    for ante in (int(a) for a in args.ante.split(',')):
+        started = time.perf_counter()
+        pot_sizes, drifts, totals = simulate(
+            args.rounds, args.players, ante, strategies, args.workers,
+            args.session_rounds, args.balance, args.seed)
+        print_report(ante, pot_sizes, drifts, totals, time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    main()
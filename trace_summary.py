@@ -0,0 +1,77 @@
+"""Summarize a round-lifecycle trace written by server.py with TRACE_FILE set.
+
+    TRACE_FILE=rounds.trace python server.py
+    python trace_summary.py rounds.trace --slowest 20
+
+Prints count, total and p50/p90/p99/max duration per span (deal,
+decision_timer, check_bets, resolve, countdown, broadcast), the tables that
+spent the most time in traced code, and the slowest individual calls with
+their table and update_id, so a slow round can be found in the raw trace.
+Several files (one per worker) can be given at once.
+"""
+import argparse
+from collections import defaultdict
+
+
+def read_spans(paths):
+    """Yield (start_us, duration_ns, span, update_id, depth, table) from trace files."""
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('#'):
+                    continue
+                fields = line.rstrip('\n').split('\t', 5)
+                if len(fields) != 6:
+                    continue  # torn last line of a running server
+                start, duration, span, update_id, depth, table = fields
+                yield int(start), int(duration), span, int(update_id), int(depth), table
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def summarize(paths, slowest):
+    durations = defaultdict(list)  # span -> [ns]
+    table_time = defaultdict(int)  # table -> ns in top-level spans
+    worst = []  # (duration_ns, span, table, update_id, start_us)
+    for start, duration, span, update_id, depth, table in read_spans(paths):
+        durations[span].append(duration)
+        if depth == 0:
+            table_time[table] += duration  # nested spans are already inside their parent
+        worst.append((duration, span, table, update_id, start))
+        if len(worst) > slowest * 20:
+            worst = sorted(worst, reverse=True)[:slowest]
+
+    if not durations:
+        print('no spans recorded')
+        return
+
+    print(f"{'span':<16}{'count':>10}{'total ms':>12}{'p50 us':>10}{'p90 us':>10}{'p99 us':>10}{'max us':>10}")
+    for span, values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+        values.sort()
+        print(f"{span:<16}{len(values):>10,}{sum(values) / 1e6:>12.1f}"
+              f"{percentile(values, 50) / 1e3:>10.1f}{percentile(values, 90) / 1e3:>10.1f}"
+              f"{percentile(values, 99) / 1e3:>10.1f}{values[-1] / 1e3:>10.1f}")
+
+    print('\nbusiest tables (time in traced code)')
+    for table, total in sorted(table_time.items(), key=lambda item: -item[1])[:10]:
+        print(f"  {total / 1e6:>10.1f} ms  {table}")
+
+    print(f'\nslowest {slowest} calls')
+    for duration, span, table, update_id, start in sorted(worst, reverse=True)[:slowest]:
+        print(f"  {duration / 1e3:>10.1f} us  {span:<16} table {table}  update {update_id}  at +{start / 1e6:.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('paths', nargs='+', help='trace files (one per worker in multi-process mode)')
+    parser.add_argument('--slowest', type=int, default=10)
+    args = parser.parse_args()
+    summarize(args.paths, args.slowest)
+
+
+if __name__ == '__main__':
+    main()